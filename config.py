@@ -1,3 +1,4 @@
 githubAppListUser = 'ma1co'
 githubAppListRepo = 'OpenMemories-AppList'
+appListSnapshotTtl = 3600
 docsUrl = 'https://openmemories.readthedocs.io'
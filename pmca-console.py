@@ -1,8 +1,12 @@
 #!/usr/bin/env python3
 """A command line application to install apps on Android-enabled Sony cameras"""
 import argparse
+import binascii
+import multiprocessing
 
+from pmca.commands.analyze import *
 from pmca.commands.backup import *
+from pmca.commands.convert import *
 from pmca.commands.market import *
 from pmca.commands.usb import *
 from pmca import spk
@@ -33,9 +37,22 @@ def main():
  apk2spk = subparsers.add_parser('apk2spk', description='Convert apk to spk')
  apk2spk.add_argument('inFile', metavar='app.apk', type=argparse.FileType('rb'), help='the apk file to convert')
  apk2spk.add_argument('outFile', metavar='app' + spk.constants.extension, type=argparse.FileType('wb'), help='the output spk file')
+ apk2spk.add_argument('-j', dest='workers', type=int, default=1, help='number of blocks to encrypt in parallel')
  spk2apk = subparsers.add_parser('spk2apk', description='Convert spk to apk')
  spk2apk.add_argument('inFile', metavar='app' + spk.constants.extension, type=argparse.FileType('rb'), help='the spk file to convert')
  spk2apk.add_argument('outFile', metavar='app.apk', type=argparse.FileType('wb'), help='the output apk file')
+ spk2apk.add_argument('-j', dest='workers', type=int, default=1, help='number of blocks to decrypt in parallel')
+ for name, ext, inExt in [('apk2spk', spk.constants.extension, '.apk'), ('spk2apk', '.apk', spk.constants.extension)]:
+  batch = subparsers.add_parser('batch_' + name, description='Convert all %s files in the given files, directories or glob patterns to %s' % (inExt, ext))
+  batch.add_argument('outDir', metavar='outdir', help='the output directory')
+  batch.add_argument('paths', metavar='path', nargs='+', help='input files, directories or glob patterns')
+  batch.add_argument('-j', dest='workers', type=int, help='number of files to convert in parallel')
+  batch.add_argument('-f', dest='force', action='store_true', help='convert files even if the output is up to date')
+ analyze = subparsers.add_parser('analyze', description='Analyze apk files or the latest releases of all apps in the app list and check their compatibility')
+ analyze.add_argument('paths', metavar='path', nargs='*', help='apk files or directories to analyze (default: the app list)')
+ analyze.add_argument('-o', dest='outFile', type=argparse.FileType('w'), help='write the report to this file')
+ analyze.add_argument('-f', dest='format', choices=['json', 'csv'], default='json', help='report format')
+ analyze.add_argument('-j', dest='workers', type=int, help='number of apps to analyze in parallel')
  firmware = subparsers.add_parser('firmware', description='Update the firmware')
  firmware.add_argument('-f', dest='datFile', type=argparse.FileType('rb'), required=True, help='the firmware file')
  firmware.add_argument('-d', dest='driver', choices=drivers, help='specify the driver')
@@ -61,7 +78,18 @@ def main():
  wifi.add_argument('-f', dest='file', type=argparse.FileType('w'), help='store current settings to file')
  wifi.add_argument('-w', dest='write', type=argparse.FileType('r'), help='program camera settings from file')
  printBackup = subparsers.add_parser('print_backup', description='Print the contents of a Backup.bin file')
- printBackup.add_argument('backupFile', metavar='Backup.bin', type=argparse.FileType('rb'), help='backup file')
+ printBackup.add_argument('backupFile', metavar='Backup.bin', help='backup file')
+ printBackup.add_argument('-o', dest='outFile', type=argparse.FileType('w'), help='write the output to this file')
+ printBackup.add_argument('-f', dest='format', choices=['text', 'json', 'csv'], default='text', help='output format')
+ diffBackup = subparsers.add_parser('diff_backup', description='Print the properties that differ between two Backup.bin files')
+ diffBackup.add_argument('oldFile', metavar='old.bin', help='old backup file')
+ diffBackup.add_argument('newFile', metavar='new.bin', help='new backup file')
+ diffBackup.add_argument('-j', dest='json', action='store_true', help='output json')
+ indexBackup = subparsers.add_parser('index_backup', description='Index Backup.bin files in a database and query it')
+ indexBackup.add_argument('dbFile', metavar='index.db', help='the index database')
+ indexBackup.add_argument('paths', metavar='path', nargs='*', help='backup files or directories to index')
+ indexBackup.add_argument('-p', dest='id', type=lambda s: int(s, 0), help='list the values of this property id')
+ indexBackup.add_argument('-v', dest='value', type=binascii.a2b_hex, help='only list the files where the property has this value (hex)')
 
  args = parser.parse_args()
  if args.command == 'info':
@@ -77,9 +105,15 @@ def main():
  elif args.command == 'market':
   marketCommand(args.token)
  elif args.command == 'apk2spk':
-  args.outFile.write(spk.dump(args.inFile.read()))
+  spk.encrypt_stream(args.inFile, args.outFile, workers=args.workers)
  elif args.command == 'spk2apk':
-  args.outFile.write(spk.parse(args.inFile.read()))
+  spk.decrypt_stream(args.inFile, args.outFile, workers=args.workers)
+ elif args.command == 'batch_apk2spk':
+  batchApkToSpkCommand(args.paths, args.outDir, args.workers, args.force)
+ elif args.command == 'batch_spk2apk':
+  batchSpkToApkCommand(args.paths, args.outDir, args.workers, args.force)
+ elif args.command == 'analyze':
+  analyzeCommand(args.paths, args.outFile, args.format, args.workers)
  elif args.command == 'firmware':
   firmwareUpdateCommand(args.datFile, args.driver)
  elif args.command == 'updatershell':
@@ -95,10 +129,17 @@ def main():
  elif args.command == 'wifi':
   wifiCommand(args.write, args.file, args.multi, args.driver)
  elif args.command == 'print_backup':
-  printBackupCommand(args.backupFile)
+  printBackupCommand(args.backupFile, args.outFile, args.format)
+ elif args.command == 'diff_backup':
+  diffBackupCommand(args.oldFile, args.newFile, args.json)
+ elif args.command == 'index_backup':
+  if args.value is not None and args.id is None:
+   indexBackup.error('-v requires -p')
+  indexBackupCommand(args.dbFile, args.paths, args.id, args.value)
  else:
   parser.print_usage()
 
 
 if __name__ == '__main__':
+ multiprocessing.freeze_support()
  main()
@@ -1,35 +1,133 @@
+from axmlparserpy.axmlparser import AXMLParser
 from axmlparserpy.axmlprinter import AXMLPrinter
+from axmlparserpy.typeconstants import START_TAG, END_DOCUMENT, TYPE_STRING
 from asn1crypto.cms import ContentInfo
+from collections import namedtuple
 from xml.dom import minidom
 from zipfile import ZipFile
 
+from . import cache
+from .. import spk
+
+# The cameras run Android 2.3.7
+compatibleSdkVersion = 10
+
+ApkManifestInfo = namedtuple('ApkManifestInfo', 'package, versionCode, versionName, minSdkVersion')
+
+class _ManifestReader(AXMLPrinter):
+ """Reads the attributes of the manifest and uses-sdk elements from binary xml without building a DOM"""
+ def __init__(self, raw_buff):
+  self.axml = AXMLParser(raw_buff)
+
+ def getAttributeValue(self, index):
+  if self.axml.getAttributeValueType(index) == TYPE_STRING:
+   return self.axml.getAttributeValue(index)
+  return super(_ManifestReader, self).getAttributeValue(index)
+
+ def _getAttributes(self):
+  return dict((self.getPrefix(self.axml.getAttributePrefix(i)) + self.axml.getAttributeName(i), self.getAttributeValue(i)) for i in range(self.axml.getAttributeCount()))
+
+ def read(self):
+  manifest = None
+  sdk = None
+  while True:
+   type = self.axml.next()
+   if type == START_TAG:
+    if manifest is None:
+     manifest = self._getAttributes()
+    elif self.getPrefix(self.axml.getPrefix()) + self.axml.getName() == 'uses-sdk':
+     sdk = self._getAttributes()
+     break
+   elif type == END_DOCUMENT:
+    break
+  if manifest is None:
+   raise Exception('Empty manifest')
+  return ApkManifestInfo(
+   package = manifest.get('package', ''),
+   versionCode = manifest.get('android:versionCode', ''),
+   versionName = manifest.get('android:versionName', ''),
+   minSdkVersion = sdk.get('android:minSdkVersion', '') if sdk is not None else None,
+  )
+
+
 class ApkParser:
- def __init__(self, file):
-  self._file = ZipFile(file)
+ def __init__(self, file, metadataCache=True):
+  """Opens an apk file. Spk files are decrypted on the fly.
+  The manifest info and certificate are looked up in metadataCache (True for the default cache, None to disable it)."""
+  self._file = file
+  self._zipFile = None
+  self._manifestInfo = None
+  self._cert = None
+  self._metadataCache = cache.getDefaultCache() if metadataCache is True else metadataCache
+
+ def _getZipFile(self):
+  if not self._zipFile:
+   file = self._file
+   if spk.isSpkFile(file):
+    file = spk.SpkReader(file)
+   self._zipFile = ZipFile(file)
+  return self._zipFile
 
  def getManifest(self):
-  return minidom.parseString(AXMLPrinter(self._file.read('AndroidManifest.xml')).getBuff())
+  return minidom.parseString(AXMLPrinter(self._getZipFile().read('AndroidManifest.xml')).getBuff())
+
+ def getManifestInfo(self):
+  """Returns the attributes of the manifest needed by the getters. The manifest is only decoded once."""
+  if not self._manifestInfo:
+   self._loadMetadata()
+  return self._manifestInfo
+
+ def _loadMetadata(self):
+  if not self._metadataCache:
+   self._manifestInfo = _ManifestReader(self._getZipFile().read('AndroidManifest.xml')).read()
+   return
+
+  hash = self._metadataCache.getHash(self._file)
+  metadata = self._metadataCache.get(hash)
+  if metadata:
+   manifestInfo, self._cert = metadata
+   self._manifestInfo = ApkManifestInfo(*manifestInfo)
+  else:
+   self._manifestInfo = _ManifestReader(self._getZipFile().read('AndroidManifest.xml')).read()
+   try:
+    self._cert = self._readCert()
+   except Exception:
+    self._cert = None
+   self._metadataCache.put(hash, self._manifestInfo, self._cert)
 
  def getPackageName(self):
-  return self.getManifest().documentElement.getAttribute('package')
+  return self.getManifestInfo().package
 
  def getVersionCode(self):
-  return int(self.getManifest().documentElement.getAttribute('android:versionCode'))
+  return int(self.getManifestInfo().versionCode)
 
  def getVersionName(self):
-  return self.getManifest().documentElement.getAttribute('android:versionName')
+  return self.getManifestInfo().versionName
 
  def getMinSdkVersion(self):
-  return int(self.getManifest().documentElement.getElementsByTagName('uses-sdk')[0].getAttribute('android:minSdkVersion'))
+  minSdkVersion = self.getManifestInfo().minSdkVersion
+  if minSdkVersion is None:
+   raise Exception('No uses-sdk element')
+  return int(minSdkVersion)
 
  def _getCerts(self):
-  for info in self._file.infolist():
+  zipFile = self._getZipFile()
+  for info in zipFile.infolist():
    if info.filename.startswith('META-INF/') and info.filename.endswith('.RSA'):
-    for cert in ContentInfo.load(self._file.read(info))['content']['certificates']:
+    for cert in ContentInfo.load(zipFile.read(info))['content']['certificates']:
      yield cert.dump()
 
- def getCert(self):
+ def _readCert(self):
   certs = list(self._getCerts())
-  if len(certs) != 1:
+  if len(certs) == 1:
+   return certs[0]
+
+ def getCert(self):
+  if self._metadataCache:
+   self.getManifestInfo()
+   cert = self._cert
+  else:
+   cert = self._readCert()
+  if not cert:
    raise Exception('Cannot read certificate')
-  return certs[0]
+  return cert
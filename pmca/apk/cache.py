@@ -0,0 +1,117 @@
+"""A persistent cache of the metadata of apk files"""
+
+import hashlib
+import io
+import os
+import sqlite3
+import threading
+
+from ..util.cache import getCacheDir
+
+# Several processes may share the database. Rather than waiting for a lock, the cache is skipped.
+_lockTimeout = .5
+
+def _getFileStat(file):
+ """Returns (path, size, mtime) if file is a file on disk"""
+ try:
+  stat = os.fstat(file.fileno())
+  return os.path.realpath(file.name), stat.st_size, stat.st_mtime_ns
+ except (AttributeError, OSError, TypeError, io.UnsupportedOperation):
+  return None
+
+def _hashFile(file):
+ pos = file.tell()
+ file.seek(0)
+ hash = hashlib.sha256()
+ while True:
+  d = file.read(0x100000)
+  if not d:
+   break
+  hash.update(d)
+ file.seek(pos)
+ return hash.digest()
+
+
+class ApkMetadataCache(object):
+ """Stores the manifest info and certificate of apk files, addressed by their SHA-256.
+ For files on disk, the hash is remembered as long as the size and mtime do not change.
+ Database errors are treated like cache misses."""
+
+ def __init__(self, dbFile=None):
+  if not dbFile:
+   dir = getCacheDir('apk')
+   os.makedirs(dir, exist_ok=True)
+   dbFile = os.path.join(dir, 'metadata.db')
+  self._lock = threading.Lock()
+  self.db = sqlite3.connect(dbFile, timeout=_lockTimeout, check_same_thread=False)
+  self.db.executescript('''
+   CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    hash BLOB NOT NULL
+   );
+   CREATE TABLE IF NOT EXISTS metadata (
+    hash BLOB PRIMARY KEY,
+    package TEXT NOT NULL,
+    versionCode TEXT NOT NULL,
+    versionName TEXT NOT NULL,
+    minSdkVersion TEXT,
+    cert BLOB
+   ) WITHOUT ROWID;
+  ''')
+
+ def close(self):
+  self.db.close()
+
+ def getHash(self, file):
+  """Returns the SHA-256 of the file. The file is only read if it changed since it was hashed last."""
+  stat = _getFileStat(file)
+  if stat:
+   try:
+    with self._lock:
+     row = self.db.execute('SELECT hash FROM files WHERE path = ? AND size = ? AND mtime = ?', stat).fetchone()
+    if row:
+     return row[0]
+   except sqlite3.Error:
+    pass
+  hash = _hashFile(file)
+  if stat:
+   try:
+    with self._lock, self.db:
+     self.db.execute('INSERT OR REPLACE INTO files (path, size, mtime, hash) VALUES (?, ?, ?, ?)', stat + (hash,))
+   except sqlite3.Error:
+    pass
+  return hash
+
+ def get(self, hash):
+  """Returns ((package, versionCode, versionName, minSdkVersion), cert) or None"""
+  try:
+   with self._lock:
+    row = self.db.execute('SELECT package, versionCode, versionName, minSdkVersion, cert FROM metadata WHERE hash = ?', (hash,)).fetchone()
+  except sqlite3.Error:
+   return None
+  if row:
+   return row[:4], row[4]
+
+ def put(self, hash, manifestInfo, cert):
+  try:
+   with self._lock, self.db:
+    self.db.execute('INSERT OR REPLACE INTO metadata (hash, package, versionCode, versionName, minSdkVersion, cert) VALUES (?, ?, ?, ?, ?, ?)', (hash,) + tuple(manifestInfo) + (cert,))
+  except sqlite3.Error:
+   pass
+
+
+_defaultCache = None
+_defaultCacheLock = threading.Lock()
+
+def getDefaultCache():
+ """Returns the metadata cache in the user's cache directory, or None if it cannot be opened"""
+ global _defaultCache
+ with _defaultCacheLock:
+  if _defaultCache is None:
+   try:
+    _defaultCache = ApkMetadataCache()
+   except Exception:
+    _defaultCache = False
+  return _defaultCache or None
@@ -1,26 +1,100 @@
 from collections import OrderedDict
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from itertools import islice
+import json
+import os
+import threading
+import time
 import yaml
 
 from .github import GithubApi
 from ..util import http
+from ..util.cache import getCacheDir
+from ..util.fs import *
+
+try:
+ from yaml import CSafeLoader as YamlLoader
+except ImportError:
+ from yaml import SafeLoader as YamlLoader
+
+def loadYamlDocuments(data):
+ """Parses the documents in a yaml stream one by one. Uses libyaml if available."""
+ return yaml.load_all(data, Loader=YamlLoader)
+
+def _findGithubAsset(assets, contentType='application/vnd.android.package-archive'):
+ for asset in assets:
+  if asset.get('content_type') == contentType:
+   return asset.get('browser_download_url')
+
+def _hasGithubApkAsset(release):
+ return bool(_findGithubAsset(release.get('assets', [])))
+
 
 class AppStore(object):
  def __init__(self, repo, branch='master', filename='apps.yaml'):
   self.repo = repo
   self.branch = branch
   self.filename = filename
+  self._apps = OrderedDict()
+  self._appList = []
+  self._appIterator = None
+  self._lock = threading.Lock()
+
+ def _parseNextApp(self):
+  """Parses the next app in the app list. Returns False at the end."""
+  if self._appIterator is None:
+   # Skip the apps which were parsed before an error
+   apps = (self._createAppInstance(dict) for dict in self._loadApps())
+   self._appIterator = islice(apps, len(self._appList), None)
+  try:
+   app = next(self._appIterator, None)
+  except:
+   # A generator cannot be resumed after an exception, start over on the next call
+   self._appIterator = None
+   raise
+  if app is None:
+   self._appIterator = iter(())
+   return False
+  self._appList.append(app)
+  self._apps[app.package] = app
+  return True
+
+ def iterApps(self):
+  """Yields the apps while the app list is being parsed"""
+  i = 0
+  while True:
+   with self._lock:
+    if i == len(self._appList) and not self._parseNextApp():
+     return
+    app = self._appList[i]
+   i += 1
+   yield app
+
+ def getApp(self, package):
+  """Returns an app, parsing the app list only as far as necessary"""
+  with self._lock:
+   while package not in self._apps:
+    if not self._parseNextApp():
+     return None
+   return self._apps[package]
 
  @property
  def apps(self):
-  if not hasattr(self, '_apps'):
-   apps = (self._createAppInstance(dict) for dict in self._loadApps())
-   self._apps = OrderedDict((app.package, app) for app in apps)
+  with self._lock:
+   while self._parseNextApp():
+    pass
   return self._apps
 
+ def prefetchReleases(self, workers=16):
+  """Loads the releases of all apps concurrently. Errors are ignored here, they are raised again when App.release is accessed."""
+  with ThreadPoolExecutor(workers) as executor:
+   list(executor.map(App._prefetchRelease, self.apps.values()))
+  return self.apps
+
  def _loadApps(self):
-  for doc in yaml.safe_load_all(self.repo.getFile(self.branch, self.filename)):
-   if 'package' in doc and 'name' in doc:
+  for doc in loadYamlDocuments(self.repo.getFile(self.branch, self.filename)):
+   if isinstance(doc, dict) and 'package' in doc and 'name' in doc:
     yield doc
 
  def _createAppInstance(self, dict):
@@ -44,30 +118,30 @@ class App(object):
    self._release = self._createReleaseInstance(dict) if dict else None
   return self._release
 
+ def _prefetchRelease(self):
+  try:
+   self.release
+  except Exception:
+   pass
+
  def _loadRelease(self):
   release = self.dict.get('release', {})
   if release.get('type') == 'github' and 'user' in release and 'repo' in release:
-   for dict in GithubApi(release['user'], release['repo']).getReleases():
-    asset = self._findGithubAsset(dict.get('assets', []))
-    if asset:
-     return {
-      'version': dict.get('name') or dict.get('tag_name'),
-      'date': datetime.strptime(dict.get('created_at'), '%Y-%m-%dT%H:%M:%SZ'),
-      'desc': dict.get('body'),
-      'url': asset,
-     }
+   dict = GithubApi(release['user'], release['repo']).findRelease(_hasGithubApkAsset)
+   if dict:
+    return {
+     'version': dict.get('name') or dict.get('tag_name'),
+     'date': datetime.strptime(dict.get('created_at'), '%Y-%m-%dT%H:%M:%SZ'),
+     'desc': dict.get('body'),
+     'url': _findGithubAsset(dict.get('assets', [])),
+    }
   elif release.get('type') == 'yaml' and 'url' in release:
-   for dict in yaml.safe_load_all(http.get(release['url']).data):
+   for dict in loadYamlDocuments(http.get(release['url'], cache=True).data):
     if 'version' in dict and 'url' in dict:
      return dict
   elif 'version' in release and 'url' in release:
    return release
 
- def _findGithubAsset(self, assets, contentType='application/vnd.android.package-archive'):
-  for asset in assets:
-   if asset.get('content_type') == contentType:
-    return asset.get('browser_download_url')
-
  def _createReleaseInstance(self, dict):
   return Release(self.package, dict)
 
@@ -87,4 +161,112 @@ class Release(object):
   return self._loadAsset()
 
  def _loadAsset(self):
-  return http.get(self.url).raw_data
+  return http.get(self.url, cache=True, text=False).raw_data
+
+ def downloadAsset(self, file, segments=4):
+  """Streams the asset to a file opened with 'r+b' or 'wb'. A partially downloaded file is resumed."""
+  http.download(self.url, file, segments=segments)
+
+
+def _encodeJson(obj):
+ if isinstance(obj, datetime):
+  return {'$datetime': obj.strftime('%Y-%m-%dT%H:%M:%S.%f')}
+ if isinstance(obj, date):
+  return {'$date': obj.isoformat()}
+ raise TypeError(repr(obj))
+
+def _decodeJson(dict):
+ if '$datetime' in dict:
+  return datetime.strptime(dict['$datetime'], '%Y-%m-%dT%H:%M:%S.%f')
+ if '$date' in dict:
+  return datetime.strptime(dict['$date'], '%Y-%m-%d').date()
+ return dict
+
+
+class AppListSnapshot(object):
+ """A copy of the app list and the releases of all apps, saved to disk.
+ Snapshots older than ttl seconds are still used, but refreshed in the background."""
+ version = 1
+
+ def __init__(self, repo, file=None, ttl=3600):
+  self.repo = repo
+  self.file = file or os.path.join(getCacheDir('appstore'), '%s-%s.json' % (repo.user, repo.repo))
+  self.ttl = ttl
+  self._refreshThread = None
+  self._backgroundApps = None
+  self._lock = threading.Lock()
+
+ def _load(self):
+  """Returns (time, apps) or None"""
+  try:
+   with open(self.file) as f:
+    snapshot = json.load(f, object_hook=_decodeJson)
+  except (OSError, ValueError):
+   return None
+  if snapshot.get('version') != self.version:
+   return None
+  apps = OrderedDict()
+  for entry in snapshot['apps']:
+   app = App(self.repo, entry['app'])
+   if 'release' in entry:
+    app._release = app._createReleaseInstance(entry['release']) if entry['release'] else None
+   apps[app.package] = app
+  return snapshot['time'], apps
+
+ def _save(self, apps):
+  entries = []
+  for app in apps.values():
+   entry = {'app': app.dict}
+   if hasattr(app, '_release'):
+    entry['release'] = app._release.dict if app._release else None
+   entries.append(entry)
+  dir = os.path.dirname(self.file)
+  os.makedirs(dir, exist_ok=True)
+  # The background refresh is killed if the program exits
+  removeStaleTempFiles(dir)
+  with atomicWrite(self.file) as f:
+   f.write(json.dumps({'version': self.version, 'time': time.time(), 'apps': entries}, default=_encodeJson).encode())
+
+ def refresh(self):
+  """Loads the app list and all releases and saves a new snapshot.
+  If a background refresh is running, its result is used instead."""
+  with self._lock:
+   thread = self._refreshThread
+  if thread and thread.is_alive():
+   thread.join()
+   if self._backgroundApps is not None:
+    return self._backgroundApps
+  return self._refresh()
+
+ def _refresh(self):
+  store = AppStore(self.repo)
+  apps = store.prefetchReleases()
+  try:
+   self._save(apps)
+  except OSError:
+   pass
+  return apps
+
+ def refreshInBackground(self):
+  with self._lock:
+   if not self._refreshThread or not self._refreshThread.is_alive():
+    self._backgroundApps = None
+    self._refreshThread = threading.Thread(target=self._refreshQuietly)
+    self._refreshThread.daemon = True
+    self._refreshThread.start()
+
+ def _refreshQuietly(self):
+  try:
+   self._backgroundApps = self._refresh()
+  except Exception:
+   pass
+
+ def getApps(self):
+  """Returns the apps from the snapshot. Without a snapshot, the app list is loaded synchronously."""
+  snapshot = self._load()
+  if not snapshot:
+   return self.refresh()
+  t, apps = snapshot
+  if time.time() - t > self.ttl:
+   self.refreshInBackground()
+  return apps
@@ -1,6 +1,12 @@
 import json
+import threading
+import time
+
 from ..util import http
 
+_releaseMemo = {}
+_releaseMemoLock = threading.Lock()
+
 class GithubApi(object):
  def __init__(self, user, repo):
   self.apiBase = 'https://api.github.com'
@@ -10,10 +16,31 @@ class GithubApi(object):
 
  def request(self, endpoint):
   url = '/repos/%s/%s' % (self.user, self.repo) + endpoint
-  return json.loads(http.get(self.apiBase + url).data)
+  return json.loads(http.get(self.apiBase + url, cache=True).data)
 
  def getFile(self, branch, path):
-  return http.get(self.rawBase + '/%s/%s/%s/%s' % (self.user, self.repo, branch, path)).data
+  return http.get(self.rawBase + '/%s/%s/%s/%s' % (self.user, self.repo, branch, path), cache=True).data
 
  def getReleases(self):
   return self.request('/releases')
+
+ def findRelease(self, predicate, memoTime=60):
+  """Returns the newest release for which predicate(release) is true.
+  The full release list is only requested if the newest release does not match.
+  Results are remembered per repository for memoTime seconds."""
+  key = (self.apiBase, self.user, self.repo, predicate)
+  with _releaseMemoLock:
+   memo = _releaseMemo.get(key)
+  if memo and time.time() - memo[0] < memoTime:
+   return memo[1]
+
+  release = None
+  releases = self.request('/releases?per_page=1')
+  if releases and predicate(releases[0]):
+   release = releases[0]
+  elif releases:
+   release = next((r for r in self.getReleases()[1:] if predicate(r)), None)
+
+  with _releaseMemoLock:
+   _releaseMemo[key] = (time.time(), release)
+  return release
@@ -1,9 +1,17 @@
 """A parser for Backup.bin, the settings file used on Sony cameras"""
 
+from array import array
 from collections import namedtuple
+import contextlib
+import mmap as _mmap
 
 from ..util import *
 
+try:
+ import numpy
+except ImportError:
+ numpy = None
+
 BackupHeader = Struct('BackupHeader', [
  ('magic', Struct.INT32),
  ('cookie', Struct.INT32),
@@ -51,9 +59,19 @@ BackupPropertyPtr = namedtuple('BackupPropertyPtr', 'attr, size, maxSize, ptr')
 
 BackupProperty = namedtuple('BackupProperty', 'attr, data, resetData')
 
-class BackupFile:
- def __init__(self, file):
+BackupPropertyDiff = namedtuple('BackupPropertyDiff', 'id, old, new')
+
+def sumBytes(data):
+ """Returns the sum of all bytes in a bytes-like object"""
+ if numpy and len(data) >= 0x1000:
+  return int(numpy.frombuffer(data, numpy.uint8).sum(dtype=numpy.uint64))
+ return sum(data)
+
+class BackupFile(contextlib.AbstractContextManager):
+ def __init__(self, file, indexed=False):
+  """Set indexed to load the property tables into memory once instead of reading them on every access"""
   self.file = file
+  self._closeFiles = []
 
   self.header = BackupHeader.unpack(self.file)
   if self.header.revision[:2] != b'BK' or self.header.revision[3:] != b'\0':
@@ -64,7 +82,8 @@ class BackupFile:
    raise Exception('Invalid backup revision')
 
   self.size = self.header.dataOffset + self.header.dataSize
-  if self.header.checksum != self._calcChecksum():
+  self._checksum = self._calcChecksum()
+  if self.header.checksum != self._checksum:
    raise Exception('Wrong checksum')
 
   self.PropertyTableEntry = PropertyTableEntryV4 if self.revision >= 4 else PropertyTableEntryV2
@@ -73,6 +92,45 @@ class BackupFile:
   if self.propertyTableOffset + self.header.numProperties * self.PropertyTableEntry.size > self.header.dataOffset:
    raise Exception('Invalid data offset')
 
+  self._subsystems = None
+  self._propertyAttrs = None
+  self._propertyPtrs = None
+  self._index = None
+  if indexed:
+   self._loadIndex()
+
+ @classmethod
+ def open(cls, path, mmap=False, writable=False, indexed=False):
+  """Opens a Backup.bin file. Set mmap to serve all reads and writes from a memory mapping of the file."""
+  files = [open(path, 'r+b' if writable else 'rb')]
+  try:
+   if mmap:
+    files.insert(0, _mmap.mmap(files[0].fileno(), 0, access=_mmap.ACCESS_WRITE if writable else _mmap.ACCESS_READ))
+   backup = cls(files[0], indexed)
+  except:
+   for f in files:
+    f.close()
+   raise
+  backup._closeFiles = files
+  return backup
+
+ def close(self):
+  """Closes the files opened by BackupFile.open()"""
+  for f in self._closeFiles:
+   f.flush()
+   f.close()
+  self._closeFiles = []
+
+ def __exit__(self, *ex):
+  self.close()
+
+ def _loadIndex(self):
+  self._subsystems = self._readSubsystemTables()
+  properties = self._readPropertyTables()
+  self._propertyAttrs = array('H', (p.attr for p in properties))
+  self._propertyPtrs = array('I', (p.ptr for p in properties))
+  self._index = {}
+
  def _read32(self, off):
   self.file.seek(off)
   return parse32le(self.file.read(4))
@@ -81,13 +139,25 @@ class BackupFile:
   self.file.seek(off)
   return self.file.write(dump32le(value))
 
+ def _write(self, off, data):
+  """Writes data to the file and keeps the checksum up to date"""
+  if off < 0x24 and off + len(data) > 0x20:
+   raise Exception('Cannot overwrite checksum')
+  self.file.seek(off)
+  old = self.file.read(len(data))
+  if off < self.size:
+   end = self.size - off
+   self._checksum += sumBytes(data[:end]) - sumBytes(old[:end])
+  self.file.seek(off)
+  return self.file.write(data)
+
  def _calcChecksum(self):
   self.file.seek(0)
   data = self.file.read(self.size)
-  return sum(bytearray(data[:0x20] + data[0x24:]))
+  return sumBytes(data) - sumBytes(data[0x20:0x24])
 
  def updateChecksum(self):
-  self._write32(0x20, self._calcChecksum())
+  self._write32(0x20, self._checksum)
 
  def getRegion(self):
   return self.header.region.decode('latin1').rstrip('\0')
@@ -96,32 +166,51 @@ class BackupFile:
   return self._read32(0x28)
 
  def setId1(self, enable):
-  return self._write32(0x28, 1 if enable else 0)
+  return self._write(0x28, dump32le(1 if enable else 0))
 
  def _readSubsystemTable(self, i):
   if i >= self.header.numSubsystems:
    raise Exception('Invalid subsystem id')
+  if self._subsystems is not None:
+   return self._subsystems[i]
   s = SubsystemTableEntry.unpack(self.file, self.subsystemTableOffset + i * SubsystemTableEntry.size)
   if s.ptr + s.numProperties > self.header.numProperties:
    raise Exception('Invalid subsystem')
   return s
 
- def _getPropertyTableOffset(self, id):
+ def _getPropertyIndex(self, id):
   subsystem = self._readSubsystemTable(id >> 16)
   i = id & 0xffff
   if i >= subsystem.numProperties:
    raise Exception('Invalid property id')
-  return self.propertyTableOffset + (subsystem.ptr + i) * self.PropertyTableEntry.size
+  return subsystem.ptr + i
+
+ def _getPropertyTableOffset(self, id):
+  return self.propertyTableOffset + self._getPropertyIndex(id) * self.PropertyTableEntry.size
 
  def _readPropertyTable(self, id):
+  if self._index is not None:
+   i = self._getPropertyIndex(id)
+   return self.PropertyTableEntry.tuple(self._propertyAttrs[i], self._propertyPtrs[i])
   return self.PropertyTableEntry.unpack(self.file, self._getPropertyTableOffset(id))
 
  def _writePropertyTable(self, id, attr, ptr):
-  self.file.seek(self._getPropertyTableOffset(id))
-  self.file.write(self.PropertyTableEntry.pack(attr=attr, ptr=ptr))
+  self._write(self._getPropertyTableOffset(id), self.PropertyTableEntry.pack(attr=attr, ptr=ptr))
+  if self._index is not None:
+   i = self._getPropertyIndex(id)
+   self._propertyAttrs[i] = attr
+   self._propertyPtrs[i] = ptr
+   self._index.pop(id, None)
 
  def _readProperty(self, id):
-  property = self._readPropertyTable(id)
+  if self._index is not None:
+   p = self._index.get(id)
+   if p is None:
+    p = self._index[id] = self._parsePropertyTableEntry(self._readPropertyTable(id))
+   return p
+  return self._parsePropertyTableEntry(self._readPropertyTable(id))
+
+ def _parsePropertyTableEntry(self, property):
   if property.ptr == 0xffffffff:
    raise Exception('Invalid property')
 
@@ -149,8 +238,15 @@ class BackupFile:
   return BackupPropertyPtr(property.attr, size, maxSize, offset)
 
  def getProperty(self, id):
+  return self._readPropertyData(self._readProperty(id))
+
+ def getPropertyData(self, id):
+  """Returns only the current data of a property, without reading its reset data"""
   p = self._readProperty(id)
+  self.file.seek(p.ptr)
+  return self.file.read(p.size)
 
+ def _readPropertyData(self, p):
   self.file.seek(p.ptr)
   data = self.file.read(p.size)
   resetData = None
@@ -174,16 +270,92 @@ class BackupFile:
   p = self._readProperty(id)
   if len(data) != p.size:
    raise Exception('Wrong data size')
-  self.file.seek(p.ptr)
-  self.file.write(data)
+  self._write(p.ptr, data)
 
  def setPropertyAttr(self, id, attr):
   self._writePropertyTable(id, attr, self._readPropertyTable(id).ptr)
 
- def listProperties(self):
-  for i in range(self.header.numSubsystems):
-   for j in range(self._readSubsystemTable(i).numProperties):
-    id = i << 16 | j
-    p = self._readPropertyTable(id)
+ def _readSubsystemTables(self):
+  subsystems = SubsystemTableEntry.unpack_array(self.file, self.subsystemTableOffset, self.header.numSubsystems)
+  if subsystems is None:
+   raise Exception('Invalid subsystem table')
+  for s in subsystems:
+   if s.ptr + s.numProperties > self.header.numProperties:
+    raise Exception('Invalid subsystem')
+  return subsystems
+
+ def _readPropertyTables(self):
+  properties = self.PropertyTableEntry.unpack_array(self.file, self.propertyTableOffset, self.header.numProperties)
+  if properties is None:
+   raise Exception('Invalid property table')
+  return properties
+
+ def _listPropertyPtrs(self):
+  if self._index is not None:
+   for i, s in enumerate(self._subsystems):
+    for j in range(s.numProperties):
+     if self._propertyPtrs[s.ptr + j] != 0xffffffff:
+      id = i << 16 | j
+      yield id, self._readProperty(id)
+   return
+
+  subsystems = self._readSubsystemTables()
+  properties = self._readPropertyTables()
+  for i, s in enumerate(subsystems):
+   for j, p in enumerate(properties[s.ptr:s.ptr+s.numProperties]):
     if p.ptr != 0xffffffff:
-     yield id, self.getProperty(id)
+     yield i << 16 | j, self._parsePropertyTableEntry(p)
+
+ def _readView(self, off, size):
+  """Returns the data at the given offset, as a memoryview if the file is memory-mapped"""
+  if isinstance(self.file, _mmap.mmap):
+   return memoryview(self.file)[off:off+size]
+  self.file.seek(off)
+  return self.file.read(size)
+
+ def listProperties(self):
+  for id, p in self._listPropertyPtrs():
+   yield id, self._readPropertyData(p)
+
+
+def _equalBytes(a, b):
+ if len(a) != len(b):
+  return False
+ if len(a) < 0x1000:
+  return a == b
+ if numpy:
+  return numpy.array_equal(numpy.frombuffer(a, numpy.uint8), numpy.frombuffer(b, numpy.uint8))
+ return bytes(a) == bytes(b)
+
+def _equalProperties(backup1, p1, backup2, p2):
+ if p1.attr != p2.attr or p1.size != p2.size:
+  return False
+ if not _equalBytes(backup1._readView(p1.ptr, p1.size), backup2._readView(p2.ptr, p2.size)):
+  return False
+ if p1.attr & 0x74 and not _equalBytes(backup1._readView(p1.ptr + p1.maxSize, p1.size), backup2._readView(p2.ptr + p2.maxSize, p2.size)):
+  return False
+ return True
+
+def diffBackups(old, new):
+ """Compares two backup files
+
+ Yields:
+  BackupPropertyDiff('property id', 'BackupProperty in old or None', 'BackupProperty in new or None') for every changed property
+ """
+ end = (0x100000000, None)
+ oldPtrs = old._listPropertyPtrs()
+ newPtrs = new._listPropertyPtrs()
+ oldId, oldPtr = next(oldPtrs, end)
+ newId, newPtr = next(newPtrs, end)
+ while oldPtr or newPtr:
+  if oldId < newId:
+   yield BackupPropertyDiff(oldId, old._readPropertyData(oldPtr), None)
+   oldId, oldPtr = next(oldPtrs, end)
+  elif newId < oldId:
+   yield BackupPropertyDiff(newId, None, new._readPropertyData(newPtr))
+   newId, newPtr = next(newPtrs, end)
+  else:
+   if not _equalProperties(old, oldPtr, new, newPtr):
+    yield BackupPropertyDiff(oldId, old._readPropertyData(oldPtr), new._readPropertyData(newPtr))
+   oldId, oldPtr = next(oldPtrs, end)
+   newId, newPtr = next(newPtrs, end)
@@ -0,0 +1,140 @@
+"""An SQLite index over a collection of Backup.bin files"""
+
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import os
+import sqlite3
+
+from . import *
+from ..util.fs import listFiles
+
+MODEL_NAME_PROPERTY = 0x003e0005
+
+BackupCorpusFile = namedtuple('BackupCorpusFile', 'path, model, region')
+
+_ScanResult = namedtuple('_ScanResult', 'path, size, mtime, model, region, properties, payloads')
+
+def _hash(data):
+ return hashlib.sha256(data).digest()
+
+def _scanBackup(path):
+ """Parses a backup file. Runs in a worker process."""
+ stat = os.stat(path)
+ properties = []
+ payloads = {}
+ with BackupFile.open(path, mmap=True, indexed=True) as backup:
+  region = backup.getRegion()
+  try:
+   model = backup.getPropertyData(MODEL_NAME_PROPERTY).decode('latin1').split('\0')[0]
+  except Exception:
+   model = None
+  for id, property in backup.listProperties():
+   hash = _hash(property.data)
+   payloads[hash] = property.data
+   resetHash = None
+   if property.resetData is not None:
+    resetHash = _hash(property.resetData)
+    payloads[resetHash] = property.resetData
+   properties.append((id, property.attr, hash, resetHash))
+ return _ScanResult(path, stat.st_size, stat.st_mtime, model, region, properties, payloads)
+
+
+class BackupCorpus(object):
+ """Indexes the properties of many backup files. Identical payloads are stored only once."""
+
+ def __init__(self, dbFile):
+  self.db = sqlite3.connect(dbFile)
+  self.db.executescript('''
+   CREATE TABLE IF NOT EXISTS files (
+    file INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    model TEXT,
+    region TEXT
+   );
+   CREATE TABLE IF NOT EXISTS payloads (
+    hash BLOB PRIMARY KEY,
+    data BLOB NOT NULL
+   ) WITHOUT ROWID;
+   CREATE TABLE IF NOT EXISTS properties (
+    file INTEGER NOT NULL REFERENCES files(file) ON DELETE CASCADE,
+    id INTEGER NOT NULL,
+    attr INTEGER NOT NULL,
+    hash BLOB NOT NULL,
+    resetHash BLOB,
+    PRIMARY KEY (file, id)
+   ) WITHOUT ROWID;
+   CREATE INDEX IF NOT EXISTS properties_id_hash ON properties (id, hash);
+  ''')
+  self.db.execute('PRAGMA foreign_keys = ON')
+
+ def close(self):
+  self.db.close()
+
+ def _isUpToDate(self, path):
+  stat = os.stat(path)
+  row = self.db.execute('SELECT size, mtime FROM files WHERE path = ?', (path,)).fetchone()
+  return row is not None and row[0] == stat.st_size and row[1] == stat.st_mtime
+
+ def _store(self, result):
+  with self.db:
+   self.db.execute('DELETE FROM files WHERE path = ?', (result.path,))
+   file = self.db.execute('INSERT INTO files (path, size, mtime, model, region) VALUES (?, ?, ?, ?, ?)', (result.path, result.size, result.mtime, result.model, result.region)).lastrowid
+   self.db.executemany('INSERT OR IGNORE INTO payloads (hash, data) VALUES (?, ?)', result.payloads.items())
+   self.db.executemany('INSERT INTO properties (file, id, attr, hash, resetHash) VALUES (?, ?, ?, ?, ?)', ((file,) + p for p in result.properties))
+
+ def update(self, paths, workers=None, prune=False):
+  """Indexes all new or modified backup files in the given files and directories
+
+  Returns:
+   ('number of indexed files', ['(path, exception)' for files that could not be parsed])
+  """
+  files = [os.path.abspath(path) for path, rel in listFiles(paths, ['.bin'])]
+
+  errors = []
+  pending = []
+  for path in files:
+   try:
+    if not self._isUpToDate(path):
+     pending.append(path)
+   except OSError as e:
+    errors.append((path, e))
+
+  count = 0
+  with ProcessPoolExecutor(workers) as executor:
+   futures = [(path, executor.submit(_scanBackup, path)) for path in pending]
+   for path, future in futures:
+    try:
+     self._store(future.result())
+     count += 1
+    except Exception as e:
+     errors.append((path, e))
+
+  if prune:
+   with self.db:
+    known = set(files)
+    for path, in self.db.execute('SELECT path FROM files').fetchall():
+     if path not in known:
+      self.db.execute('DELETE FROM files WHERE path = ?', (path,))
+    self.db.execute('DELETE FROM payloads WHERE hash NOT IN (SELECT hash FROM properties UNION SELECT resetHash FROM properties WHERE resetHash IS NOT NULL)')
+
+  return count, errors
+
+ def listFiles(self):
+  for path, model, region in self.db.execute('SELECT path, model, region FROM files ORDER BY path'):
+   yield BackupCorpusFile(path, model, region)
+
+ def findFiles(self, id, data):
+  """Lists the backup files in which the given property has the given value"""
+  for path, model, region in self.db.execute('SELECT f.path, f.model, f.region FROM properties p JOIN files f ON f.file = p.file WHERE p.id = ? AND p.hash = ? ORDER BY f.path', (id, _hash(data))):
+   yield BackupCorpusFile(path, model, region)
+
+ def countValues(self, id):
+  """Counts how many backup files have each value of the given property
+
+  Returns:
+   [('property data', 'number of files'), ...]
+  """
+  return self.db.execute('SELECT d.data, COUNT(*) FROM properties p JOIN payloads d ON d.hash = p.hash WHERE p.id = ? GROUP BY p.hash ORDER BY COUNT(*) DESC', (id,)).fetchall()
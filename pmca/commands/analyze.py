@@ -0,0 +1,98 @@
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import csv
+import hashlib
+import io
+import json
+import sys
+
+import config
+from ..apk import *
+from .. import appstore
+from .. import spk
+from ..util.fs import listFiles
+
+_reportFields = ['source', 'package', 'versionCode', 'versionName', 'minSdkVersion', 'cert', 'warnings', 'error']
+
+def _analyzeApk(apkFile):
+ """Returns the manifest fields, certificate fingerprint and compatibility warnings of an apk"""
+ result = OrderedDict()
+ warnings = []
+ apk = ApkParser(apkFile)
+ result['package'] = apk.getPackageName()
+ result['versionCode'] = apk.getVersionCode()
+ result['versionName'] = apk.getVersionName()
+ try:
+  result['minSdkVersion'] = apk.getMinSdkVersion()
+  if result['minSdkVersion'] > compatibleSdkVersion:
+   warnings.append('This app might not be compatible with the device (minSdkVersion = %d)' % result['minSdkVersion'])
+ except Exception:
+  result['minSdkVersion'] = None
+  warnings.append('Cannot read minSdkVersion')
+ try:
+  result['cert'] = hashlib.sha256(apk.getCert()).hexdigest()
+ except Exception:
+  result['cert'] = None
+  warnings.append('Cannot read apk certificate')
+ result['warnings'] = warnings
+ return result
+
+def _analyzeFile(path):
+ """Returns (path, result). Errors are reported in the result."""
+ try:
+  with open(path, 'rb') as f:
+   result = _analyzeApk(f)
+ except Exception as e:
+  result = OrderedDict(error='Invalid apk file: %s' % e)
+ return path, result
+
+def _analyzeApp(app):
+ """Downloads and analyzes the latest release of an app"""
+ try:
+  if not app.release:
+   raise Exception('No release found')
+  result = _analyzeApk(io.BytesIO(app.release.asset))
+ except Exception as e:
+  result = OrderedDict(error=str(e))
+ return app.package, result
+
+def _writeReportJson(rows, out):
+ json.dump([OrderedDict((k, row.get(k)) for k in _reportFields) for row in rows], out, indent=2)
+ out.write('\n')
+
+def _writeReportCsv(rows, out):
+ writer = csv.writer(out, lineterminator='\n')
+ writer.writerow(_reportFields)
+ for row in rows:
+  writer.writerow(['; '.join(row[k]) if k == 'warnings' else row.get(k, '') for k in _reportFields])
+
+def analyzeCommand(paths=None, outFile=None, format='json', workers=None):
+ """Analyzes the apk files in the given files and directories, or the latest releases of all apps in the app store.
+ Progress is printed to stderr, so the report can be written to stdout."""
+ with ProcessPoolExecutor(workers) as executor:
+  if paths:
+   results = executor.map(_analyzeFile, [f for f, rel in listFiles(paths, ['.apk', spk.constants.extension])])
+  else:
+   print('Loading app list', file=sys.stderr)
+   store = appstore.AppStore(appstore.GithubApi(config.githubAppListUser, config.githubAppListRepo))
+   apps = store.apps
+   print('Found %d apps' % len(apps), file=sys.stderr)
+   store.prefetchReleases()
+   results = executor.map(_analyzeApp, list(apps.values()))
+
+  rows = []
+  for source, result in results:
+   row = OrderedDict(source=source, warnings=[])
+   row.update(result)
+   rows.append(row)
+   if 'error' in row:
+    print('%s: Error: %s' % (source, row['error']), file=sys.stderr)
+   for warning in row['warnings']:
+    print('%s: Warning: %s' % (source, warning), file=sys.stderr)
+
+ print('%d apps analyzed, %d with warnings, %d failed' % (len(rows), sum(1 for row in rows if row['warnings']), sum(1 for row in rows if 'error' in row)), file=sys.stderr)
+
+ {
+  'json': _writeReportJson,
+  'csv': _writeReportCsv,
+ }[format](rows, outFile or sys.stdout)
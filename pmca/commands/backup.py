@@ -1,18 +1,137 @@
+import binascii
+import csv
+import json
+import sys
+
 from ..backup import *
+from ..backup.corpus import *
 
-def printHexDump(data, n=16, indent=0):
- for i in range(0, len(data), n):
-  line = bytearray(data[i:i+n])
-  hex = ' '.join('%02x' % c for c in line)
-  text = ''.join(chr(c) if 0x21 <= c <= 0x7e else '.' for c in line)
-  print('%*s%-*s %s' % (indent, '', n*3, hex, text))
+_hexDumpAsciiTable = bytes(c if 0x21 <= c <= 0x7e else ord('.') for c in range(256))
+_hexDumpByteTable = ['%02x ' % c for c in range(256)]
 
-def printBackupCommand(file):
- """Prints all properties in a Backup.bin file"""
- for id, property in BackupFile(file).listProperties():
-  print('id=0x%08x, size=0x%04x, attr=0x%02x:' % (id, len(property.data), property.attr))
-  printHexDump(property.data, indent=2)
+def formatHexDump(data, n=16, indent=0):
+ """Returns a hex dump of data, n bytes per line"""
+ data = bytes(data)
+ hex = ''.join(map(_hexDumpByteTable.__getitem__, data))
+ text = data.translate(_hexDumpAsciiTable).decode('ascii')
+ prefix = ' ' * indent
+ return ''.join('%s%-*s %s\n' % (prefix, n*3, hex[i*3:(i+n)*3-1], text[i:i+n]) for i in range(0, len(data), n))
+
+def printHexDump(data, n=16, indent=0, file=None):
+ (file or sys.stdout).write(formatHexDump(data, n, indent))
+
+class _BufferedWriter(object):
+ """Collects output and writes it in large blocks"""
+ def __init__(self, file, blockSize=0x100000):
+  self._file = file
+  self._blockSize = blockSize
+  self._buffer = []
+  self._size = 0
+
+ def write(self, s):
+  self._buffer.append(s)
+  self._size += len(s)
+  if self._size >= self._blockSize:
+   self.flush()
+
+ def flush(self):
+  self._file.write(''.join(self._buffer))
+  self._buffer = []
+  self._size = 0
+
+def _writeBackupText(backup, out):
+ for id, property in backup.listProperties():
+  out.write('id=0x%08x, size=0x%04x, attr=0x%02x:\n' % (id, len(property.data), property.attr))
+  out.write(formatHexDump(property.data, indent=2))
   if property.resetData and property.resetData != property.data:
-   print('reset data:')
-   printHexDump(property.resetData, indent=2)
-  print('')
+   out.write('reset data:\n')
+   out.write(formatHexDump(property.resetData, indent=2))
+  out.write('\n')
+
+def _writeBackupJson(backup, out):
+ out.write('[')
+ for i, (id, property) in enumerate(backup.listProperties()):
+  out.write((',\n' if i else '\n') + json.dumps(dict(id=id, **_propertyToDict(property))))
+ out.write('\n]\n')
+
+def _writeBackupCsv(backup, out):
+ writer = csv.writer(out, lineterminator='\n')
+ writer.writerow(['id', 'attr', 'size', 'data', 'resetData'])
+ for id, property in backup.listProperties():
+  d = _propertyToDict(property)
+  writer.writerow(['0x%08x' % id, '0x%02x' % d['attr'], len(property.data), d['data'], d['resetData'] or ''])
+
+def printBackupCommand(path, outFile=None, format='text'):
+ """Prints all properties in a Backup.bin file"""
+ out = _BufferedWriter(outFile or sys.stdout)
+ with BackupFile.open(path, mmap=True, indexed=True) as backup:
+  {
+   'text': _writeBackupText,
+   'json': _writeBackupJson,
+   'csv': _writeBackupCsv,
+  }[format](backup, out)
+ out.flush()
+
+
+def _propertyToDict(property):
+ if property is None:
+  return None
+ return {
+  'attr': property.attr,
+  'data': binascii.hexlify(property.data).decode('ascii'),
+  'resetData': binascii.hexlify(property.resetData).decode('ascii') if property.resetData is not None else None,
+ }
+
+def diffBackupCommand(oldPath, newPath, outputJson=False):
+ """Prints the properties that differ between two Backup.bin files"""
+ with BackupFile.open(oldPath, mmap=True) as old, BackupFile.open(newPath, mmap=True) as new:
+  diffs = diffBackups(old, new)
+  if outputJson:
+   print(json.dumps([{'id': diff.id, 'old': _propertyToDict(diff.old), 'new': _propertyToDict(diff.new)} for diff in diffs], indent=2))
+   return
+
+  for diff in diffs:
+   if diff.old is None:
+    print('id=0x%08x: added' % diff.id)
+   elif diff.new is None:
+    print('id=0x%08x: removed' % diff.id)
+   else:
+    print('id=0x%08x:' % diff.id)
+   if diff.old and diff.new and diff.old.attr != diff.new.attr:
+    print('attr: 0x%02x -> 0x%02x' % (diff.old.attr, diff.new.attr))
+   for name, property in [('old', diff.old), ('new', diff.new)]:
+    if property is None:
+     continue
+    other = diff.new if property is diff.old else diff.old
+    if not other or property.data != other.data:
+     print('%s data:' % name)
+     printHexDump(property.data, indent=2)
+    if property.resetData is not None and (not other or property.resetData != other.resetData):
+     print('%s reset data:' % name)
+     printHexDump(property.resetData, indent=2)
+   print('')
+
+
+def indexBackupCommand(dbFile, paths, id=None, value=None):
+ """Indexes Backup.bin files in an SQLite database and queries the index"""
+ if value is not None and id is None:
+  raise Exception('A property id is required to search for a value')
+ corpus = BackupCorpus(dbFile)
+ try:
+  if paths:
+   print('Indexing backup files')
+   count, errors = corpus.update(paths)
+   for path, e in errors:
+    print('Error: %s: %s' % (path, e))
+   print('%d files indexed' % count)
+   print('')
+
+  if id is not None and value is not None:
+   for file in corpus.findFiles(id, value):
+    print('%s (%s, %s)' % file)
+  elif id is not None:
+   for data, count in corpus.countValues(id):
+    print('%d files:' % count)
+    printHexDump(data, indent=2)
+ finally:
+  corpus.close()
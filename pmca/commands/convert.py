@@ -0,0 +1,102 @@
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import os
+import re
+import time
+
+from .. import spk
+from ..util.fs import *
+
+_ConvertJob = namedtuple('_ConvertJob', 'inFile, outFile')
+_ConvertResult = namedtuple('_ConvertResult', 'inFile, outFile, inSize, outSize, skipped, error')
+
+_apkExtension = '.apk'
+
+def _apkToSpkName(fn):
+ return re.sub('(%s)?$' % re.escape(_apkExtension), spk.constants.extension, fn, count=1, flags=re.IGNORECASE)
+
+def _spkToApkName(fn):
+ return re.sub('(%s)?$' % re.escape(spk.constants.extension), _apkExtension, fn, count=1)
+
+def _getApkSize(spkFile, codec):
+ """Only the last block has to be decrypted"""
+ with open(spkFile, 'rb') as f:
+  return spk.SpkReader(f, cacheSize=1, codec=codec).seek(0, os.SEEK_END)
+
+def _isUpToDate(inFile, outFile, expectedSize):
+ """Converted files get the modification time of their source, so this works like rsync's quick check"""
+ try:
+  inStat = os.stat(inFile)
+  outStat = os.stat(outFile)
+ except OSError:
+  return False
+ return outStat.st_mtime_ns == inStat.st_mtime_ns and outStat.st_size == expectedSize(inFile)
+
+def _convertFile(job, convert, expectedSize, force):
+ inSize = 0
+ try:
+  inSize = os.path.getsize(job.inFile)
+  if not force and _isUpToDate(job.inFile, job.outFile, expectedSize):
+   return _ConvertResult(job.inFile, job.outFile, inSize, os.path.getsize(job.outFile), True, None)
+  dir = os.path.dirname(job.outFile)
+  if dir:
+   os.makedirs(dir, exist_ok=True)
+  with open(job.inFile, 'rb') as src, atomicWrite(job.outFile) as dst:
+   convert(src, dst)
+  inStat = os.stat(job.inFile)
+  os.utime(job.outFile, ns=(inStat.st_atime_ns, inStat.st_mtime_ns))
+  return _ConvertResult(job.inFile, job.outFile, inSize, os.path.getsize(job.outFile), False, None)
+ except Exception as e:
+  return _ConvertResult(job.inFile, job.outFile, inSize, 0, False, e)
+
+def _findConflicts(jobs):
+ """Returns the output files which more than one input file would be converted to"""
+ inFiles = {}
+ for job in jobs:
+  inFiles.setdefault(os.path.normcase(os.path.abspath(job.outFile)), set()).add(os.path.realpath(job.inFile))
+ return set(outFile for outFile, files in inFiles.items() if len(files) > 1)
+
+def _batchConvert(jobs, convert, expectedSize, workers=None, force=False):
+ """Converts the files using a thread pool. Yields the results in order."""
+ conflicts = _findConflicts(jobs)
+ def run(job):
+  if os.path.normcase(os.path.abspath(job.outFile)) in conflicts:
+   return _ConvertResult(job.inFile, job.outFile, 0, 0, False, Exception('Another input file has the same output file'))
+  return _convertFile(job, convert, expectedSize, force)
+ with ThreadPoolExecutor(workers or os.cpu_count()) as executor:
+  for result in executor.map(run, jobs):
+   yield result
+
+def _batchConvertCommand(paths, outDir, extension, rename, convert, expectedSize, workers=None, force=False):
+ jobs = [_ConvertJob(f, os.path.join(outDir, rename(rel))) for f, rel in listFiles(paths, [extension])]
+ print('Converting %d files' % len(jobs))
+
+ start = time.time()
+ converted = skipped = failed = 0
+ inBytes = outBytes = 0
+ for result in _batchConvert(jobs, convert, expectedSize, workers, force):
+  if result.error:
+   failed += 1
+   print('%s: Error: %s' % (result.inFile, result.error))
+  elif result.skipped:
+   skipped += 1
+  else:
+   converted += 1
+   inBytes += result.inSize
+   outBytes += result.outSize
+   print('%s -> %s' % (result.inFile, result.outFile))
+ duration = max(time.time() - start, 1e-6)
+
+ print('')
+ print('%d converted, %d up to date, %d failed' % (converted, skipped, failed))
+ print('%.1f MB read, %.1f MB written in %.2f s (%.1f MB/s)' % (inBytes / 1e6, outBytes / 1e6, duration, inBytes / 1e6 / duration))
+
+def batchApkToSpkCommand(paths, outDir, workers=None, force=False):
+ """Converts all apk files in the given files, directories and glob patterns to spk"""
+ codec = spk.SpkCodec()
+ _batchConvertCommand(paths, outDir, _apkExtension, _apkToSpkName, codec.encrypt_stream, lambda f: codec.getSpkSize(os.path.getsize(f)), workers, force)
+
+def batchSpkToApkCommand(paths, outDir, workers=None, force=False):
+ """Converts all spk files in the given files, directories and glob patterns to apk"""
+ codec = spk.SpkCodec()
+ _batchConvertCommand(paths, outDir, spk.constants.extension, _spkToApkName, codec.decrypt_stream, lambda f: _getApkSize(f, codec), workers, force)
@@ -1,17 +1,26 @@
+import io
 import os
 import re
 
 from .. import marketclient
+from ..marketclient.catalog import MarketCatalog
 from .. import spk
 
 def marketCommand(token):
  devices = marketclient.getDevices(token)
  print('%d devices found\n' % len(devices))
 
+ catalog = MarketCatalog()
+ try:
+  catalog.sync(device.name for device in devices)
+  deviceApps = [(device, list(catalog.getApps(device.name))) for device in devices]
+ finally:
+  catalog.close()
+
  apps = []
- for device in devices:
+ for device, deviceAppList in deviceApps:
   print('%s (%s)' % (device.name, device.serial))
-  for app in marketclient.getApps(device.name):
+  for app in deviceAppList:
    if not app.price:
     apps.append((device.deviceid, app.id))
     print(' [%2d] %s' % (len(apps), app.name))
@@ -26,12 +35,11 @@ def marketCommand(token):
    print('Downloading app %s' % app[1])
    spkName, spkData = marketclient.download(token, app[0], app[1])
    fn = re.sub('(%s)?$' % re.escape(spk.constants.extension), '.apk', spkName)
-   data = spk.parse(spkData)
 
    if os.path.exists(fn):
     print('File %s exists already' % fn)
    else:
     with open(fn, 'wb') as f:
-     f.write(data)
+     spk.decrypt_stream(io.BytesIO(spkData), f)
     print('App written to %s' % fn)
    print('')
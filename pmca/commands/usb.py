@@ -12,6 +12,7 @@ from ..apk import *
 from .. import appstore
 from .. import firmware
 from .. import installer
+from ..spk.cache import *
 from ..io import *
 from ..marketserver.server import *
 from ..platform import *
@@ -31,29 +32,40 @@ def printStatus(status):
  print('%s %d%%' % (status.message, status.percent))
 
 
-appListCache = None
-def listApps(enableCache=False):
- global appListCache
- appStoreRepo = appstore.GithubApi(config.githubAppListUser, config.githubAppListRepo)
+_appListSnapshot = None
+
+def _getAppListSnapshot():
+ """The snapshot is shared, so that only one refresh runs at a time"""
+ global _appListSnapshot
+ if not _appListSnapshot:
+  _appListSnapshot = appstore.AppListSnapshot(appstore.GithubApi(config.githubAppListUser, config.githubAppListRepo), ttl=config.appListSnapshotTtl)
+ return _appListSnapshot
 
- if not appListCache or not enableCache:
+def listApps(enableCache=False):
+ """Returns the app list. If enableCache is set, the local snapshot is used if there is one."""
+ snapshot = _getAppListSnapshot()
+ if enableCache:
+  apps = snapshot.getApps()
+ else:
   print('Loading app list')
-  apps = appstore.AppStore(appStoreRepo).apps
+  apps = snapshot.refresh()
   print('Found %d apps' % len(apps))
-  appListCache = apps
- return appListCache
+ return apps
 
 
 def installApp(dev, apkFile=None, appPackage=None, outFile=None):
  """Installs an app on the specified device."""
  certFile = scriptRoot + '/certs/localtest.me.pem'
- with ServerContext(LocalMarketServer(certFile)) as server:
+ with ServerContext(LocalMarketServer(certFile, spkCache=SpkCache())) as server:
   apkData = None
   if apkFile:
    apkData = apkFile.read()
   elif appPackage:
    print('Downloading apk')
    apps = listApps(True)
+   if appPackage not in apps:
+    # The snapshot might be outdated
+    apps = listApps()
    if appPackage not in apps:
     raise Exception('Unknown app: %s' % appPackage)
    apkData = apps[appPackage].release.asset
@@ -98,7 +110,7 @@ def checkApk(apkFile):
    print('%-9s%s' % (k + ': ', v))
 
   sdk = apk.getMinSdkVersion()
-  if sdk > 10:
+  if sdk > compatibleSdkVersion:
    print('Warning: This app might not be compatible with the device (minSdkVersion = %d)' % sdk)
 
   try:
@@ -305,7 +317,7 @@ def installCommand(driverName=None, apkFile=None, appPackage=None, outFile=None)
 
 
 def appSelectionCommand():
- apps = list(listApps().values())
+ apps = list(listApps(True).values())
  for i, app in enumerate(apps):
   print(' [%2d] %s' % (i+1, app.package))
  i = int(input('Enter number of app to install (0 to abort): '))
@@ -466,7 +478,9 @@ def gpsUpdateCommand(file=None, driverName=None):
 
    if not file:
     print('Downloading GPS data')
-    file = io.BytesIO(http.get('https://control.d-imaging.sony.co.jp/GPS/assistme.dat').raw_data)
+    file = io.BytesIO()
+    http.download('https://control.d-imaging.sony.co.jp/GPS/assistme.dat', file)
+    file.seek(0)
 
    print('Writing GPS data')
    SonyExtCmdCamera(device).writeGpsData(file)
@@ -58,7 +58,7 @@ def downloadXpd(portalid, deviceid, appid):
   'portalid': portalid,
   'deviceid': deviceid,
   'localeid': constants.localeUs,
- }).raw_data
+ }, text=False).raw_data
 
 def parseXpd(data):
  """Parses an xpd file
@@ -75,5 +75,5 @@ def downloadSpk(url):
  Returns:
   ('file name', 'spk data')
  """
- response = http.get(url, auth = (constants.downloadAuthUser, constants.downloadAuthPassword))
+ response = http.get(url, auth = (constants.downloadAuthUser, constants.downloadAuthPassword), text = False)
  return posixpath.basename(response.url.path), response.raw_data
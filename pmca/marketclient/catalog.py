@@ -0,0 +1,81 @@
+"""A local SQLite copy of the app lists of the PMCA store"""
+
+from collections import OrderedDict
+import os
+import sqlite3
+import time
+
+from . import *
+from ..util.cache import getCacheDir
+
+class MarketCatalog(object):
+ """Stores every app once and remembers which apps are available for which device"""
+
+ def __init__(self, dbFile=None, maxAge=86400):
+  if not dbFile:
+   dir = getCacheDir('market')
+   os.makedirs(dir, exist_ok=True)
+   dbFile = os.path.join(dir, 'catalog.db')
+  self.maxAge = maxAge
+  self.db = sqlite3.connect(dbFile)
+  self.db.executescript('''
+   CREATE TABLE IF NOT EXISTS apps (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    img TEXT,
+    price TEXT,
+    date INTEGER NOT NULL
+   );
+   CREATE TABLE IF NOT EXISTS devices (
+    name TEXT PRIMARY KEY,
+    syncTime REAL NOT NULL,
+    syncDate INTEGER NOT NULL
+   );
+   CREATE TABLE IF NOT EXISTS deviceApps (
+    device TEXT NOT NULL REFERENCES devices(name) ON DELETE CASCADE,
+    app TEXT NOT NULL REFERENCES apps(id),
+    position INTEGER NOT NULL,
+    PRIMARY KEY (device, app)
+   ) WITHOUT ROWID;
+  ''')
+  self.db.execute('PRAGMA foreign_keys = ON')
+
+ def close(self):
+  self.db.close()
+
+ def _storeApps(self, apps):
+  self.db.executemany('INSERT OR REPLACE INTO apps (id, name, img, price, date) VALUES (?, ?, ?, ?, ?)', apps)
+
+ def _isUpToDate(self, devicename, newestDate):
+  row = self.db.execute('SELECT syncTime, syncDate FROM devices WHERE name = ?', (devicename,)).fetchone()
+  return row is not None and time.time() - row[0] < self.maxAge and row[1] >= newestDate
+
+ def sync(self, devicenames):
+  """Updates the catalog. The complete app list is downloaded once.
+  The app list of a device is only downloaded again if apps have been added since it was last synced, or after maxAge seconds.
+
+  Returns:
+   The number of device app lists that were downloaded
+  """
+  apps = list(getApps())
+  newestDate = max((app.date for app in apps), default=0)
+  with self.db:
+   self._storeApps(apps)
+
+  count = 0
+  for devicename in OrderedDict.fromkeys(devicenames):
+   if self._isUpToDate(devicename, newestDate):
+    continue
+   deviceApps = list(getApps(devicename))
+   with self.db:
+    self._storeApps(deviceApps)
+    self.db.execute('DELETE FROM devices WHERE name = ?', (devicename,))
+    self.db.execute('INSERT INTO devices (name, syncTime, syncDate) VALUES (?, ?, ?)', (devicename, time.time(), newestDate))
+    self.db.executemany('INSERT OR IGNORE INTO deviceApps (device, app, position) VALUES (?, ?, ?)', ((devicename, app.id, i) for i, app in enumerate(deviceApps)))
+   count += 1
+  return count
+
+ def getApps(self, devicename):
+  """Lists the apps compatible with the given device, as returned by the last sync"""
+  for row in self.db.execute('SELECT a.id, a.name, a.img, a.price, a.date FROM deviceApps d JOIN apps a ON a.id = d.app WHERE d.device = ? ORDER BY d.position', (devicename,)):
+   yield MarketApp(*row)
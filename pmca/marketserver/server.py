@@ -1,5 +1,8 @@
 import contextlib
 from http.server import BaseHTTPRequestHandler
+import io
+import os
+import shutil
 from socketserver import TCPServer
 from threading import Thread
 import tlslite
@@ -15,14 +18,17 @@ class HttpHandler(BaseHTTPRequestHandler):
  def log_request(self, code='-', size='-'):
   pass
 
- def output(self, mimeType, data, filename=None):
+ def outputHeaders(self, mimeType, size, filename=None):
   self.send_response(200)
   self.send_header('Connection', 'Keep-Alive')
   self.send_header('Content-Type', mimeType)
-  self.send_header('Content-Length', len(data))
+  self.send_header('Content-Length', size)
   if filename:
    self.send_header('Content-Disposition', 'attachment;filename="%s"' % filename)
   self.end_headers()
+
+ def output(self, mimeType, data, filename=None):
+  self.outputHeaders(mimeType, len(data), filename)
   self.wfile.write(data)
 
  def do_POST(self):
@@ -41,11 +47,14 @@ class LocalMarketServer(TCPServer):
  """A local https server to communicate with the camera"""
  allow_reuse_address = True
 
- def __init__(self, certFile, host='127.0.0.1', port=4443):
+ def __init__(self, certFile, host='127.0.0.1', port=4443, spkCache=None):
   super(LocalMarketServer, self).__init__((host, port), HttpHandler)
   self.url = 'https://' + host + '/'
   self.apk = None
+  self.spkFile = None
   self.result = None
+  self.spkCache = spkCache
+  self.codec = spkCache.codec if spkCache else spk.SpkCodec()
 
   with open(certFile) as f:
    cert = f.read()
@@ -67,6 +76,12 @@ class LocalMarketServer(TCPServer):
 
  def setApk(self, apkData):
   self.apk = apkData
+  self.spkFile = None
+  if self.spkCache and apkData:
+   try:
+    self.spkFile = self.spkCache.getSpkFile(apkData)
+   except Exception:
+    pass
 
  def getXpd(self):
   """Return the xpd contents"""
@@ -92,7 +107,18 @@ class LocalMarketServer(TCPServer):
  def handleGet(self, handler):
   """Handle GET requests to the server"""
   # Send the spk file to the camera
-  handler.output(spk.constants.mimeType, spk.dump(self.apk), 'app%s' % spk.constants.extension)
+  if self.spkFile:
+   try:
+    f = open(self.spkFile, 'rb')
+   except OSError:
+    pass
+   else:
+    with f:
+     handler.outputHeaders(spk.constants.mimeType, os.fstat(f.fileno()).st_size, 'app%s' % spk.constants.extension)
+     shutil.copyfileobj(f, handler.wfile, spk.constants.blockSize)
+    return
+  handler.outputHeaders(spk.constants.mimeType, self.codec.getSpkSize(len(self.apk)), 'app%s' % spk.constants.extension)
+  self.codec.encrypt_stream(io.BytesIO(self.apk), handler.wfile)
 
 
 class ServerContext(contextlib.AbstractContextManager):
@@ -18,7 +18,7 @@ class UsbSequenceTransfer(object):
   d = self._dev.sendSonyExtCommand(self._cmd, UsbSequenceTransferHeader.pack(
    sequence = self._sequence
   ) + data, UsbSequenceTransferHeader.size + bufferSize)
-  if UsbSequenceTransferHeader.unpack(d[:UsbSequenceTransferHeader.size]).sequence != self._sequence:
+  if UsbSequenceTransferHeader.unpack(d).sequence != self._sequence:
    raise Exception("Wrong sequence")
   self._sequence += 1
   return d[UsbSequenceTransferHeader.size:]
@@ -91,7 +91,11 @@ def usb_transfer_socket(transfer, conn):
    rxSize = USB_SOCKET_BUFFER_SIZE if rxBuf == b'' else 0,
    txSize = len(txBuf),
   )
-  slaveHeader = UsbSocketHeader.unpack(transfer.send(UsbSocketHeader.pack(**masterHeader._asdict()), UsbSocketHeader.size))
+  slaveHeader = UsbSocketHeader.unpack(transfer.send(UsbSocketHeader.pack(
+   status = masterHeader.status,
+   rxSize = masterHeader.rxSize,
+   txSize = masterHeader.txSize,
+  ), UsbSocketHeader.size))
 
   # Calculate transfer size
   rxSize = min(masterHeader.rxSize, slaveHeader.txSize)
@@ -82,13 +82,13 @@ class BackupPlatformDataInterface(BackupDataInterface):
 
 class BackupFileDataInterface(BackupDataInterface):
  def __init__(self, file):
-  self.backup = BackupFile(file)
+  self.backup = BackupFile(file, indexed=True)
 
  def getRegion(self):
   return self.backup.getRegion()
 
  def readProp(self, id):
-  return self.backup.getProperty(id).data
+  return self.backup.getPropertyData(id)
 
  def writeProp(self, id, data):
   self.backup.setProperty(id, data)
@@ -128,7 +128,7 @@ class BackupPatchDataInterface(BackupPlatformFileDataInterface):
   return super(BackupPatchDataInterface, self).readProp(id)
 
  def writeProp(self, id, data):
-  if len(data) != len(self.backup.getProperty(id).data):
+  if len(data) != len(self.backup.getPropertyData(id)):
    raise Exception('Wrong data size')
   self.patch[id] = data
 
@@ -9,6 +9,12 @@ except ImportError:
  from Crypto.PublicKey import RSA
  from Crypto.Util.number import bytes_to_long, long_to_bytes
 
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import io
+import os
+import threading
+
 from . import constants
 from . import util
 from ..util import *
@@ -23,26 +29,56 @@ SpkKeyHeader = Struct('SpkKeyHeader', [
  ('keySize', Struct.INT32),
 ])
 
-def parse(data):
+def parse(data, workers=1):
  """Parses an spk file
 
  Returns:
   The contained apk data
  """
- encryptedKey, encryptedData = parseContainer(data)
- key = decryptKey(encryptedKey)
- return decryptData(key, encryptedData)
+ return _defaultCodec.parse(data, workers)
 
-def dump(data):
+def dump(data, workers=1):
  """Builds an spk file containing the apk data specified"""
- encryptedKey = constants.sampleSpkKey
- key = decryptKey(encryptedKey)
- encryptedData = encryptData(key, data)
- return dumpContainer(encryptedKey, encryptedData)
+ return _defaultCodec.dump(data, workers)
+
+def encrypt_stream(src, dst, workers=1):
+ """Reads apk data from src and writes the spk file to dst, one block at a time"""
+ _defaultCodec.encrypt_stream(src, dst, workers)
+
+def decrypt_stream(src, dst, workers=1):
+ """Reads an spk file from src and writes the contained apk data to dst, one block at a time"""
+ _defaultCodec.decrypt_stream(src, dst, workers)
+
+def _readContainerHeader(file):
+ """Reads the header of an spk file up to the encrypted data
+
+ Returns:
+  The encrypted key
+ """
+ header = SpkHeader.unpack(util.readFully(file, SpkHeader.size))
+ if not header or header.magic != spkHeaderMagic:
+  raise Exception('Wrong magic')
+ util.readFully(file, header.keyOffset)
+ keyHeader = SpkKeyHeader.unpack(util.readFully(file, SpkKeyHeader.size))
+ return util.readFully(file, keyHeader.keySize)
+
+def getSpkSize(apkSize, encryptedKey=constants.sampleSpkKey):
+ """Returns the size of the spk file built from an apk of the given size"""
+ numBlocks, lastBlockSize = divmod(apkSize, constants.blockSize)
+ size = SpkHeader.size + SpkKeyHeader.size + len(encryptedKey) + numBlocks * (constants.blockSize + constants.paddingSize)
+ if lastBlockSize:
+  size += (lastBlockSize // constants.paddingSize + 1) * constants.paddingSize
+ return size
 
 def isSpk(data):
  return len(data) >= SpkHeader.size and SpkHeader.unpack(data).magic == spkHeaderMagic
 
+def isSpkFile(file):
+ pos = file.tell()
+ data = file.read(SpkHeader.size)
+ file.seek(pos)
+ return isSpk(data)
+
 def parseContainer(data):
  """Parses an spk file
 
@@ -71,12 +107,148 @@ def decryptKey(encryptedKey):
   # pycryptodome
   return long_to_bytes(rsa._encrypt(bytes_to_long(encryptedKey)))
 
-def decryptData(key, encryptedData):
+def _encryptBlock(aes, block):
+ return aes.encrypt(util.pad(block, constants.paddingSize))
+
+def _decryptBlock(aes, block):
+ return util.unpad(aes.decrypt(block))
+
+def _mapBlocks(function, blocks, workers=1):
+ """Applies the function to every block and yields the results in order. Uses a thread pool if workers > 1."""
+ if workers <= 1:
+  for block in blocks:
+   yield function(block)
+  return
+
+ with ThreadPoolExecutor(workers) as executor:
+  pending = deque()
+  for block in blocks:
+   pending.append(executor.submit(function, block))
+   if len(pending) >= 2 * workers:
+    yield pending.popleft().result()
+  while pending:
+   yield pending.popleft().result()
+
+def decryptData(key, encryptedData, workers=1):
  """Decrypts the apk data using the specified AES key"""
- aes = AES.new(key, AES.MODE_ECB)
- return b''.join(util.unpad(aes.decrypt(c)) for c in util.chunk(encryptedData, constants.blockSize + constants.paddingSize))
+ return _decryptData(AES.new(key, AES.MODE_ECB), encryptedData, workers)
 
-def encryptData(key, data):
+def encryptData(key, data, workers=1):
  """Encrypts the apk data using the specified AES key"""
- aes = AES.new(key, AES.MODE_ECB)
- return b''.join(aes.encrypt(util.pad(c, constants.paddingSize)) for c in util.chunk(data, constants.blockSize))
+ return _encryptData(AES.new(key, AES.MODE_ECB), data, workers)
+
+def _decryptData(aes, encryptedData, workers=1):
+ return b''.join(_mapBlocks(lambda block: _decryptBlock(aes, block), util.chunk(encryptedData, constants.blockSize + constants.paddingSize), workers))
+
+def _encryptData(aes, data, workers=1):
+ return b''.join(_mapBlocks(lambda block: _encryptBlock(aes, block), util.chunk(data, constants.blockSize), workers))
+
+
+class SpkCodec(object):
+ """Converts between apk and spk files. The content keys of recently used encrypted keys are cached."""
+
+ def __init__(self, encryptedKey=constants.sampleSpkKey, cacheSize=16):
+  self.encryptedKey = encryptedKey
+  self._cacheSize = cacheSize
+  self._ciphers = OrderedDict()
+  self._lock = threading.Lock()
+
+ def getCipher(self, encryptedKey):
+  """Returns an AES cipher for the content key of the given encrypted key"""
+  with self._lock:
+   aes = self._ciphers.get(encryptedKey)
+   if aes is not None:
+    self._ciphers.move_to_end(encryptedKey)
+    return aes
+  aes = AES.new(decryptKey(encryptedKey), AES.MODE_ECB)
+  with self._lock:
+   self._ciphers[encryptedKey] = aes
+   if len(self._ciphers) > self._cacheSize:
+    self._ciphers.popitem(last=False)
+  return aes
+
+ def parse(self, data, workers=1):
+  encryptedKey, encryptedData = parseContainer(data)
+  return _decryptData(self.getCipher(encryptedKey), encryptedData, workers)
+
+ def dump(self, data, workers=1):
+  return dumpContainer(self.encryptedKey, _encryptData(self.getCipher(self.encryptedKey), data, workers))
+
+ def encrypt_stream(self, src, dst, workers=1):
+  aes = self.getCipher(self.encryptedKey)
+  dst.write(dumpContainer(self.encryptedKey, b''))
+  for block in _mapBlocks(lambda block: _encryptBlock(aes, block), util.readBlocks(src, constants.blockSize), workers):
+   dst.write(block)
+
+ def decrypt_stream(self, src, dst, workers=1):
+  aes = self.getCipher(_readContainerHeader(src))
+  for block in _mapBlocks(lambda block: _decryptBlock(aes, block), util.readBlocks(src, constants.blockSize + constants.paddingSize), workers):
+   dst.write(block)
+
+ def getSpkSize(self, apkSize):
+  return getSpkSize(apkSize, self.encryptedKey)
+
+_defaultCodec = SpkCodec()
+
+class SpkReader(io.RawIOBase):
+ """A seekable file object to read the apk data in an spk file. Only the blocks which are read are decrypted."""
+ encryptedBlockSize = constants.blockSize + constants.paddingSize
+
+ def __init__(self, file, cacheSize=4, codec=None):
+  self._file = file
+  self._cacheSize = cacheSize
+  self._cache = OrderedDict()
+  self._pos = 0
+
+  self._aes = (codec or _defaultCodec).getCipher(_readContainerHeader(file))
+  self._dataOffset = file.tell()
+
+  encryptedSize = file.seek(0, os.SEEK_END) - self._dataOffset
+  self._numBlocks = -(-encryptedSize // self.encryptedBlockSize)
+  self._size = 0
+  if self._numBlocks:
+   self._size = (self._numBlocks - 1) * constants.blockSize + len(self._getBlock(self._numBlocks - 1))
+
+ def _getBlock(self, i):
+  block = self._cache.get(i)
+  if block is not None:
+   self._cache.move_to_end(i)
+   return block
+  self._file.seek(self._dataOffset + i * self.encryptedBlockSize)
+  block = _decryptBlock(self._aes, util.readFully(self._file, self.encryptedBlockSize))
+  self._cache[i] = block
+  if len(self._cache) > self._cacheSize:
+   self._cache.popitem(last=False)
+  return block
+
+ def readable(self):
+  return True
+
+ def seekable(self):
+  return True
+
+ def tell(self):
+  return self._pos
+
+ def seek(self, offset, whence=os.SEEK_SET):
+  if whence == os.SEEK_CUR:
+   offset += self._pos
+  elif whence == os.SEEK_END:
+   offset += self._size
+  if offset < 0:
+   raise ValueError('Negative seek position')
+  self._pos = offset
+  return self._pos
+
+ def readinto(self, b):
+  view = memoryview(b).cast('B')
+  n = max(min(len(view), self._size - self._pos), 0)
+  written = 0
+  while written < n:
+   i, offset = divmod(self._pos + written, constants.blockSize)
+   block = self._getBlock(i)
+   size = min(len(block) - offset, n - written)
+   view[written:written+size] = block[offset:offset+size]
+   written += size
+  self._pos += written
+  return written
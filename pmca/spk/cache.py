@@ -0,0 +1,20 @@
+"""An on-disk cache of spk files"""
+
+import hashlib
+import io
+
+from . import SpkCodec
+from ..util.cache import *
+
+class SpkCache(object):
+ """Keeps the spk files built from apk files, addressed by the SHA-256 of the apk"""
+
+ def __init__(self, dir=None, maxSize=0x20000000, codec=None):
+  self.codec = codec or SpkCodec()
+  self._cache = FileCache(dir or getCacheDir('spk'), maxSize)
+  self._keySuffix = '-' + hashlib.sha256(self.codec.encryptedKey).hexdigest()[:16]
+
+ def getSpkFile(self, apkData):
+  """Returns the path of the spk file for the given apk. It is built if it is not in the cache."""
+  key = hashlib.sha256(apkData).hexdigest() + self._keySuffix
+  return self._cache.get(key) or self._cache.put(key, lambda f: self.codec.encrypt_stream(io.BytesIO(apkData), f))
@@ -13,3 +13,22 @@ def unpad(data):
 def chunk(data, size):
  """Splits a string in chunks of the given size"""
  return (data[i:i+size] for i in range(0, len(data), size))
+
+def readFully(file, size):
+ """Reads size bytes from a file. Returns less data only at the end of the file."""
+ parts = []
+ while size > 0:
+  d = file.read(size)
+  if not d:
+   break
+  parts.append(d)
+  size -= len(d)
+ return b''.join(parts)
+
+def readBlocks(file, size):
+ """Reads a file in blocks of the given size"""
+ while True:
+  block = readFully(file, size)
+  if not block:
+   break
+  yield block
@@ -75,6 +75,10 @@ class MtpDevice(UsbDevice):
  PTP_RC_DeviceBusy = 0x2019
  PTP_RC_SessionAlreadyOpened = 0x201E
 
+ IntArrayEntry = Struct('IntArrayEntry', [
+  ('value', Struct.INT16),
+ ])
+
  def __init__(self, driver):
   super(MtpDevice, self).__init__(driver)
   self.openSession()
@@ -96,8 +100,8 @@ class MtpDevice(UsbDevice):
  def _parseIntArray(self, data, offset):
   length = parse32le(data[offset:offset+4])
   offset += 4
-  end = offset + 2*length
-  return end, [parse16le(data[o:o+2]) for o in range(offset, end, 2)]
+  end = offset + length*self.IntArrayEntry.size
+  return end, [e.value for e in self.IntArrayEntry.iter_unpack(data, offset, length)]
 
  def _parseDeviceInfo(self, data):
   offset = 8
@@ -199,12 +199,15 @@ class MtpDriver(GenericUsbDriver, BaseMtpDriver):
  TYPE_RESPONSE = 3
 
  def _writePtp(self, type, code, transaction, data=b''):
-  self.write(PtpHeader.pack(
-   size = PtpHeader.size + len(data),
+  buffer = bytearray(PtpHeader.size + len(data))
+  PtpHeader.pack_into(buffer, 0,
+   size = len(buffer),
    type = type,
    code = code,
    transaction = transaction,
-  ) + data)
+  )
+  buffer[PtpHeader.size:] = data
+  self.write(buffer)
 
  def _readPtp(self):
   data = b''
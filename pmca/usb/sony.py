@@ -535,7 +535,7 @@ class SonyUpdaterCamera(object):
 
  def _parseWriteResponse(self, data):
   response = self.WriteResponse.unpack(data)
-  status = [self.WriteResponseStatus.unpack(data, self.WriteResponse.size+i*self.WriteResponseStatus.size).code for i in range(response.numStatus)]
+  status = [s.code for s in self.WriteResponseStatus.iter_unpack(data, self.WriteResponse.size, response.numStatus)]
   return response.windowSize, status
 
  def _statusToStr(self, status):
@@ -729,7 +729,7 @@ class SonyAppInstallCamera(object):
    data = data[self.CommonMsgHeader.size:header.size]
    if header.type == self.SONY_MSG_Common_Hello:
     n = self.ProtocolMsgHeader.unpack(data).numProtocols
-    protos = (self.ProtocolMsgProto.unpack(data, self.ProtocolMsgHeader.size+i*self.ProtocolMsgProto.size) for i in range(n))
+    protos = self.ProtocolMsgProto.iter_unpack(data, self.ProtocolMsgHeader.size, n)
     return InitResponseMessage([(p.name, p.id) for p in protos])
    elif header.type == self.SONY_MSG_Common_Bye:
     raise Exception('Bye from camera')
@@ -1,7 +1,9 @@
 """Some utility functions to pack and unpack integers"""
 
-import struct
 from collections import namedtuple
+import mmap
+from operator import itemgetter
+import struct
 
 def parse32le(data):
  return struct.unpack('<I', data)[0]
@@ -33,6 +35,8 @@ def parse8(data):
 def dump8(value):
  return struct.pack('B', value)
 
+_bufferTypes = (bytes, bytearray, memoryview, mmap.mmap)
+
 class Struct(object):
  LITTLE_ENDIAN = '<'
  BIG_ENDIAN = '>'
@@ -47,17 +51,59 @@ class Struct(object):
  def __init__(self, name, fields, byteorder=LITTLE_ENDIAN):
   self.tuple = namedtuple(name, (n for n, fmt in fields if not isinstance(fmt, int)))
   self.format = byteorder + ''.join(self.PADDING % fmt if isinstance(fmt, int) else fmt for n, fmt in fields)
-  self.size = struct.calcsize(self.format)
+  self._struct = struct.Struct(self.format)
+  self._make = self.tuple._make
+  self._getter = itemgetter(*self.tuple._fields) if len(self.tuple._fields) > 1 else lambda d: tuple(d[n] for n in self.tuple._fields)
+  self.size = self._struct.size
+
+ def _values(self, kwargs):
+  if len(kwargs) == len(self.tuple._fields):
+   try:
+    return self._getter(kwargs)
+   except KeyError:
+    pass
+  # Let the namedtuple raise the appropriate TypeError
+  return self.tuple(**kwargs)
 
  def unpack(self, data, offset = 0):
-  if isinstance(data, bytes):
-   data = data[offset:offset+self.size]
-  else:
+  """Unpacks the struct from a bytes-like object or mmap (without copying) or from a file"""
+  if not isinstance(data, _bufferTypes):
    data.seek(offset)
    data = data.read(self.size)
-  if len(data) < self.size:
+   offset = 0
+  if len(data) - offset < self.size:
    return None
-  return self.tuple._make(struct.unpack_from(self.format, data))
+  return self._make(self._struct.unpack_from(data, offset))
+
+ def _view(self, data, offset, count):
+  if not isinstance(data, _bufferTypes):
+   data.seek(offset)
+   data = data.read(-1 if count is None else count * self.size)
+   offset = 0
+  view = memoryview(data)[offset:]
+  if count is None:
+   count = len(view) // self.size
+  if len(view) < count * self.size:
+   return None
+  return view[:count * self.size]
+
+ def iter_unpack(self, data, offset = 0, count = None):
+  """Unpacks consecutive structs from a bytes-like object or a file. Decodes as many as fit if count is None."""
+  view = self._view(data, offset, count)
+  if view is None:
+   raise Exception('Data too short')
+  return map(self._make, self._struct.iter_unpack(view))
+
+ def unpack_array(self, data, offset = 0, count = None):
+  """Like iter_unpack, but returns a list. Returns None if the data is too short."""
+  view = self._view(data, offset, count)
+  if view is None:
+   return None
+  return list(map(self._make, self._struct.iter_unpack(view)))
 
  def pack(self, **kwargs):
-  return struct.pack(self.format, *self.tuple(**kwargs))
+  return self._struct.pack(*self._values(kwargs))
+
+ def pack_into(self, buffer, offset = 0, **kwargs):
+  """Packs the struct into a writable buffer at the given offset"""
+  self._struct.pack_into(buffer, offset, *self._values(kwargs))
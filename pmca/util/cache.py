@@ -0,0 +1,71 @@
+"""A size-bounded on-disk cache"""
+
+import os
+import sys
+
+from .fs import *
+
+def getCacheDir(name):
+ """Returns the per-user cache directory for pmca"""
+ if sys.platform == 'win32':
+  base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+ elif sys.platform == 'darwin':
+  base = os.path.expanduser('~/Library/Caches')
+ else:
+  base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+ return os.path.join(base, 'pmca', name)
+
+
+class FileCache(object):
+ """Stores one file per key in a directory. The least recently used files are deleted if the total size exceeds maxSize."""
+
+ def __init__(self, dir, maxSize):
+  self.dir = dir
+  self.maxSize = maxSize
+
+ def _getPath(self, key):
+  return os.path.join(self.dir, key[:2], key)
+
+ def get(self, key):
+  """Returns the path of the cached file or None"""
+  path = self._getPath(key)
+  try:
+   os.utime(path)
+  except OSError:
+   return None
+  return path
+
+ def put(self, key, write):
+  """Creates the file for a key by calling write(file). Returns the path of the cached file."""
+  path = self._getPath(key)
+  os.makedirs(os.path.dirname(path), exist_ok=True)
+  removeStaleTempFiles(os.path.dirname(path))
+  with atomicWrite(path) as f:
+   write(f)
+  self.evict(path)
+  return path
+
+ def _listFiles(self):
+  for dir, dirs, files in os.walk(self.dir):
+   for fn in files:
+    if not fn.startswith('.'):
+     path = os.path.join(dir, fn)
+     try:
+      stat = os.stat(path)
+     except OSError:
+      continue
+     yield stat.st_mtime, stat.st_size, path
+
+ def evict(self, keep=None):
+  """Deletes the least recently used files until the cache fits into maxSize"""
+  files = sorted(self._listFiles())
+  size = sum(s for t, s, p in files)
+  for mtime, s, path in files:
+   if size <= self.maxSize:
+    break
+   if path != keep:
+    try:
+     os.remove(path)
+    except OSError:
+     pass
+    size -= s
@@ -0,0 +1,61 @@
+"""File system helpers"""
+
+from contextlib import contextmanager
+import glob
+import os
+import tempfile
+import time
+
+# mkstemp creates files which are only accessible by the owner
+_umask = os.umask(0)
+os.umask(_umask)
+
+@contextmanager
+def atomicWrite(path):
+ """Yields a binary file object. Its contents replace the file at path if the block completes without errors."""
+ fd, tmpFile = tempfile.mkstemp(dir=os.path.dirname(path) or os.curdir, prefix='.', suffix='.tmp')
+ try:
+  with os.fdopen(fd, 'wb') as f:
+   os.chmod(tmpFile, 0o666 & ~_umask)
+   yield f
+  os.replace(tmpFile, path)
+ except:
+  os.remove(tmpFile)
+  raise
+
+def removeStaleTempFiles(dir, maxAge=3600):
+ """Deletes the temporary files of atomicWrite calls which were interrupted more than maxAge seconds ago"""
+ try:
+  files = os.listdir(dir)
+ except OSError:
+  return
+ for fn in files:
+  if fn.startswith('.') and fn.endswith('.tmp'):
+   path = os.path.join(dir, fn)
+   try:
+    if time.time() - os.stat(path).st_mtime > maxAge:
+     os.remove(path)
+   except OSError:
+    pass
+
+def listFiles(paths, extensions):
+ """Expands the directories and glob patterns in paths. Directories are searched recursively for files with one of the given extensions.
+
+ Yields:
+  ('path', 'path relative to the directory it was found in')
+ """
+ extensions = tuple(e.lower() for e in extensions)
+ for path in paths:
+  if os.path.isdir(path):
+   for dir, dirs, files in os.walk(path):
+    dirs.sort()
+    for fn in sorted(files):
+     if fn.lower().endswith(extensions):
+      f = os.path.join(dir, fn)
+      yield f, os.path.relpath(f, path)
+  elif glob.has_magic(path):
+   for f in sorted(glob.glob(path)):
+    if os.path.isfile(f):
+     yield f, os.path.basename(f)
+  else:
+   yield path, os.path.basename(path)
@@ -1,35 +1,381 @@
 """Some methods to make HTTP requests"""
 
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import http.client
+from http.client import NOT_MODIFIED
+import json
+import os
+import re
+import threading
+import time
+import zlib
+from urllib.error import HTTPError, URLError
 from urllib.parse import *
 from urllib.request import *
 
+from .cache import *
+
 HttpResponse = namedtuple('HttpResponse', 'url, data, raw_data, headers')
 
-def get(url, data={}, headers={}, cookies={}, auth=None):
+HttpCacheEntry = namedtuple('HttpCacheEntry', 'url, headers, body, expires')
+
+def get(url, data={}, headers={}, cookies={}, auth=None, cache=None, text=True):
  if data:
   url += '?' + urlencode(data)
- return request(url, None, headers, cookies, auth)
+ return request(url, None, headers, cookies, auth, cache, text)
 
 def post(url, data, headers={}, cookies={}, auth=None):
  return request(url, data, headers, cookies, auth)
 
-def request(url, data=None, headers={}, cookies={}, auth=None):
+def request(url, data=None, headers={}, cookies={}, auth=None, cache=None, text=True):
+ """Sends an HTTP request. Anonymous GET requests are looked up in cache (an HttpCache or True for the default cache).
+ The body is only decoded to HttpResponse.data if text is set."""
+ if cache is True:
+  cache = getDefaultCache()
+ if data is not None or cookies or auth:
+  cache = None
+
+ headers = dict(headers)
+ entry = cache.load(url) if cache else None
+ if entry:
+  if entry.expires > time.time():
+   return _createResponse(entry.url, entry.headers, entry.body, text)
+  etag = _getHeader(entry.headers, 'ETag')
+  if etag:
+   headers['If-None-Match'] = etag
+  lastModified = _getHeader(entry.headers, 'Last-Modified')
+  if lastModified:
+   headers['If-Modified-Since'] = lastModified
+
  if cookies:
   headers['Cookie'] = '; '.join(quote(k) + '=' + quote(v) for (k, v) in cookies.items())
- request = Request(str(url), data, headers)
- manager = HTTPPasswordMgrWithDefaultRealm()
- if auth:
-  manager.add_password(None, request.get_full_url(), auth[0], auth[1])
- handlers = [HTTPBasicAuthHandler(manager), HTTPDigestAuthHandler(manager)]
+ headers.setdefault('Accept-Encoding', 'gzip')
  try:
-  import certifi, ssl
-  handlers.append(HTTPSHandler(context=ssl.create_default_context(cafile=certifi.where())))
- except:
-  # App engine
-  pass
- response = build_opener(*handlers).open(request)
+  response = client.open(Request(str(url), data, headers), auth)
+ except HTTPError as e:
+  if entry and e.code == NOT_MODIFIED:
+   e.read()
+   cache.refresh(url, entry, dict(e.headers))
+   return _createResponse(entry.url, entry.headers, entry.body, text)
+  raise
  headers = dict(response.headers)
  raw_contents = response.read()
- contents = raw_contents.decode(headers.get('charset', 'latin1'))
- return HttpResponse(urlparse(response.geturl()), contents, raw_contents, headers)
+ if response.headers.get('Content-Encoding', '').lower() == 'gzip':
+  raw_contents = zlib.decompress(raw_contents, 16 + zlib.MAX_WBITS)
+  headers = dict((k, v) for k, v in headers.items() if k.lower() != 'content-encoding')
+ if cache:
+  cache.store(url, response.geturl(), headers, raw_contents)
+ return _createResponse(response.geturl(), headers, raw_contents, text)
+
+def _getHeader(headers, name, default=None):
+ """Looks up a header in a dict, ignoring the case of the name"""
+ name = name.lower()
+ return next((v for k, v in headers.items() if k.lower() == name), default)
+
+class _PooledHTTPResponse(http.client.HTTPResponse):
+ """Calls _release when the body has been read completely"""
+ _release = None
+
+ def _close_conn(self):
+  super(_PooledHTTPResponse, self)._close_conn()
+  if self._release:
+   release = self._release
+   self._release = None
+   release()
+
+ def close(self):
+  if not self.isclosed():
+   # The rest of the body is still on the wire, so the connection cannot be reused
+   self._release = None
+  super(_PooledHTTPResponse, self).close()
+
+
+class _PooledHTTPConnection(http.client.HTTPConnection):
+ response_class = _PooledHTTPResponse
+
+class _PooledHTTPSConnection(http.client.HTTPSConnection):
+ response_class = _PooledHTTPResponse
+
+
+class _PooledHTTPHandler(HTTPHandler):
+ """Like urllib's HTTPHandler, but connections are kept alive and reused"""
+ def __init__(self, client):
+  super(_PooledHTTPHandler, self).__init__()
+  self.client = client
+
+ def http_open(self, req):
+  return self.client.openConnection(_PooledHTTPConnection, req)
+
+class _PooledHTTPSHandler(HTTPSHandler):
+ """Like urllib's HTTPSHandler, but connections are kept alive and reused"""
+ def __init__(self, client):
+  super(_PooledHTTPSHandler, self).__init__()
+  self.client = client
+
+ def https_open(self, req):
+  return self.client.openConnection(_PooledHTTPSConnection, req, context=self.client.getSslContext())
+
+
+class HttpClient(object):
+ """Sends requests over a pool of keep-alive connections. All https connections share one SSL context."""
+ maxIdleConnections = 4
+ maxIdleTime = 30
+
+ def __init__(self):
+  self._idle = {}
+  self._lock = threading.Lock()
+  self._sslContext = None
+
+ def getSslContext(self):
+  with self._lock:
+   if not self._sslContext:
+    try:
+     import certifi, ssl
+     self._sslContext = ssl.create_default_context(cafile=certifi.where())
+    except:
+     # App engine
+     pass
+   return self._sslContext
+
+ def _getConnection(self, key):
+  with self._lock:
+   connections = self._idle.get(key, [])
+   while connections:
+    conn, t = connections.pop()
+    if time.time() - t < self.maxIdleTime:
+     return conn
+    conn.close()
+
+ def _putConnection(self, key, conn):
+  with self._lock:
+   connections = self._idle.setdefault(key, [])
+   if len(connections) < self.maxIdleConnections:
+    connections.append((conn, time.time()))
+    return
+  conn.close()
+
+ def openConnection(self, connectionClass, req, **args):
+  key = (connectionClass, req.host, req._tunnel_host)
+  headers = dict(req.unredirected_hdrs)
+  headers.update((k, v) for k, v in req.headers.items() if k not in headers)
+  headers = dict((name.title(), val) for name, val in headers.items())
+
+  tunnelHeaders = {}
+  if req._tunnel_host:
+   # Connecting through an https proxy, the proxy credentials must not be sent to the origin server
+   proxyAuth = 'Proxy-Authorization'
+   if proxyAuth in headers:
+    tunnelHeaders[proxyAuth] = headers.pop(proxyAuth)
+
+  while True:
+   conn = self._getConnection(key)
+   reused = conn is not None
+   if not reused:
+    conn = connectionClass(req.host, timeout=req.timeout, **args)
+    if req._tunnel_host:
+     conn.set_tunnel(req._tunnel_host, headers=tunnelHeaders)
+   try:
+    conn.request(req.get_method(), req.selector, req.data, headers, encode_chunked=req.has_header('Transfer-encoding'))
+    response = conn.getresponse()
+    break
+   except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError) as e:
+    # The server has closed an idle connection
+    conn.close()
+    if not reused:
+     raise URLError(e)
+   except OSError as e:
+    conn.close()
+    raise URLError(e)
+   except:
+    conn.close()
+    raise
+
+  if not response.will_close:
+   response._release = lambda: self._putConnection(key, conn)
+  response.url = req.get_full_url()
+  response.msg = response.reason
+  return response
+
+ def open(self, request, auth=None):
+  manager = HTTPPasswordMgrWithDefaultRealm()
+  if auth:
+   manager.add_password(None, request.get_full_url(), auth[0], auth[1])
+  return build_opener(_PooledHTTPHandler(self), _PooledHTTPSHandler(self), HTTPBasicAuthHandler(manager), HTTPDigestAuthHandler(manager)).open(request)
+
+client = HttpClient()
+
+def _createResponse(url, headers, raw_contents, text=True):
+ contents = raw_contents.decode(headers.get('charset', 'latin1')) if text else None
+ return HttpResponse(urlparse(url), contents, raw_contents, headers)
+
+
+def _parseContentRange(value):
+ """Returns (start, end, total) from a Content-Range header. total is None if it is unknown."""
+ m = re.match(r'bytes (\d+)-(\d+)/(\d+|\*)', value or '')
+ if not m:
+  m = re.match(r'bytes \*/(\d+)', value or '')
+  return (None, None, int(m.group(1))) if m else None
+ return int(m.group(1)), int(m.group(2)), int(m.group(3)) if m.group(3) != '*' else None
+
+def download(url, file, headers={}, auth=None, resume=True, segments=1, minSegmentSize=0x100000, chunkSize=0x10000):
+ """Downloads url to a binary file object in chunks.
+ Files on disk have to be opened with 'r+b' (to resume) or 'wb', since seeking does not work in append mode.
+ If resume is set and the file already contains data, only the rest is requested with an HTTP Range header.
+ If segments > 1 and the server supports ranges, the rest is fetched in this many parallel requests.
+
+ Returns:
+  The parsed url of the response
+ """
+ if 'a' in getattr(file, 'mode', ''):
+  raise ValueError('Cannot download to a file opened in append mode')
+ start = file.seek(0, os.SEEK_END) if resume and file.seekable() else 0
+ headers = dict(headers)
+ headers['Accept-Encoding'] = 'identity'
+ headers['Range'] = 'bytes=%d-' % start
+ try:
+  response = client.open(Request(str(url), None, headers), auth)
+ except HTTPError as e:
+  contentRange = _parseContentRange(e.headers.get('Content-Range'))
+  if e.code == 416 and contentRange and contentRange[2] == start:
+   # The file is complete already
+   e.read()
+   return urlparse(url)
+  raise
+
+ with response:
+  url = response.geturl()
+  if response.status == 206:
+   contentRange = _parseContentRange(response.headers.get('Content-Range'))
+   if not contentRange or contentRange[0] != start:
+    raise Exception('Invalid Content-Range')
+   total = contentRange[2]
+  else:
+   # The server has sent the whole file
+   if start:
+    file.seek(0)
+    file.truncate()
+   start = 0
+   total = None
+
+  if segments > 1 and total and total - start >= segments * minSegmentSize:
+   bounds = [start + (total - start) * i // segments for i in range(segments + 1)]
+   _downloadSegments(url, response, file, bounds, headers, auth, chunkSize)
+  else:
+   pos = start
+   while True:
+    d = response.read(chunkSize)
+    if not d:
+     break
+    file.write(d)
+    pos += len(d)
+   if total and pos != total:
+    raise Exception('Incomplete download')
+ return urlparse(url)
+
+def _downloadSegments(url, firstResponse, file, bounds, headers, auth, chunkSize):
+ """Fetches the byte ranges between bounds in parallel. The first range is read from firstResponse.
+ If a segment fails, the file is truncated to the data that was received without gaps, so the download can be resumed."""
+ lock = threading.Lock()
+ progress = [0] * (len(bounds) - 1)
+
+ def fetchSegment(i):
+  pos, end = bounds[i], bounds[i+1]
+  if i == 0:
+   response = firstResponse
+  else:
+   response = client.open(Request(url, None, dict(headers, Range='bytes=%d-%d' % (pos, end - 1))), auth)
+   contentRange = _parseContentRange(response.headers.get('Content-Range'))
+   if response.status != 206 or not contentRange or contentRange[0] != pos:
+    response.close()
+    raise Exception('Server does not support range requests')
+  with response:
+   while pos < end:
+    d = response.read(min(chunkSize, end - pos))
+    if not d:
+     raise Exception('Incomplete download')
+    with lock:
+     file.seek(pos)
+     file.write(d)
+    pos += len(d)
+    progress[i] += len(d)
+
+ with ThreadPoolExecutor(len(progress)) as executor:
+  futures = [executor.submit(fetchSegment, i) for i in range(len(progress))]
+  errors = [e for e in (future.exception() for future in futures) if e]
+
+ if errors:
+  end = bounds[0]
+  for i, size in enumerate(progress):
+   end = bounds[i] + size
+   if end < bounds[i+1]:
+    break
+  file.seek(end)
+  file.truncate()
+  raise errors[0]
+ file.seek(bounds[-1])
+
+
+class HttpCache(object):
+ """Stores responses on disk. Stale responses are revalidated with their ETag and Last-Modified headers.
+ Responses are fresh for the max-age sent by the server, or ttl seconds if there is none."""
+
+ def __init__(self, dir=None, maxSize=0x10000000, ttl=0):
+  self._cache = FileCache(dir or getCacheDir('http'), maxSize)
+  self.ttl = ttl
+
+ def _getKey(self, url):
+  return hashlib.sha256(url.encode('utf8')).hexdigest()
+
+ def _getExpires(self, headers):
+  cacheControl = _getHeader(headers, 'Cache-Control', '')
+  if 'no-cache' in cacheControl:
+   return 0
+  m = re.search(r'max-age=(\d+)', cacheControl)
+  return time.time() + (int(m.group(1)) if m else self.ttl)
+
+ def load(self, url):
+  """Returns the cached HttpCacheEntry or None"""
+  path = self._cache.get(self._getKey(url))
+  if not path:
+   return None
+  try:
+   with open(path, 'rb') as f:
+    meta = json.loads(f.readline().decode('utf8'))
+    body = f.read()
+  except (OSError, ValueError):
+   return None
+  return HttpCacheEntry(meta['url'], meta['headers'], body, meta['expires'])
+
+ def _put(self, url, entry):
+  meta = json.dumps({'url': entry.url, 'headers': entry.headers, 'expires': entry.expires}).encode('utf8') + b'\n'
+  def write(f):
+   f.write(meta)
+   f.write(entry.body)
+  try:
+   self._cache.put(self._getKey(url), write)
+  except OSError:
+   pass
+
+ def store(self, url, responseUrl, headers, body):
+  if 'no-store' in _getHeader(headers, 'Cache-Control', ''):
+   return
+  self._put(url, HttpCacheEntry(responseUrl, headers, body, self._getExpires(headers)))
+
+ def refresh(self, url, entry, headers):
+  """Updates the expiration of an entry after it has been revalidated"""
+  expires = self._getExpires(headers)
+  if expires > time.time():
+   self._put(url, entry._replace(expires=expires))
+
+
+_defaultCache = None
+_defaultCacheLock = threading.Lock()
+
+def getDefaultCache():
+ global _defaultCache
+ with _defaultCacheLock:
+  if not _defaultCache:
+   _defaultCache = HttpCache()
+  return _defaultCache